@@ -309,7 +309,7 @@ export class EcsClusterStack extends Stack {
             command: [
                 'sh',
                 '-c',
-                'python manage.py migrate && python manage.py loaddata initial_data.json && python manage.py runserver 0.0.0.0:8000 --noreload',
+                'python manage.py migrate && python manage.py loaddata initial_data.json && (python manage.py dispatch_billing_outbox &) && python manage.py runserver 0.0.0.0:8000 --noreload',
             ],
             rules: [this.DISCOVERY_SERVER_CW_CONFIG],
             healthCheck: healthCheck,
@@ -1,10 +1,11 @@
 import boto3
 from datetime import datetime, timedelta, timezone
 
+client = boto3.client('cloudtrail')
+
 def execute_test(test_case):
     """Execute CloudTrail test"""
-    client = boto3.client('cloudtrail')
-    
+
     time_range_minutes = test_case.get('time_range_minutes', 100)
     end_time = datetime.now(timezone.utc)
     start_time = end_time - timedelta(minutes=time_range_minutes)
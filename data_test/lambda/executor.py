@@ -0,0 +1,79 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# AWS API each test type mostly calls, the test cases of one API share its concurrency limit
+TEST_TYPE_APIS = {
+    'metrics': 'cloudwatch',
+    'traces': 'xray',
+    'logs': 'logs',
+    'tags': 'tagging',
+    'otel_resource_attributes': 'logs',
+    'cloudtrail': 'cloudtrail'
+}
+
+# Concurrent test cases per API, kept under the default throttling quotas:
+# X-Ray GetTraceSummaries/BatchGetTraces 5 TPS, Logs Insights StartQuery 5 TPS and
+# 30 concurrent queries, GetMetricData 50 TPS, CloudTrail LookupEvents 2 TPS.
+DEFAULT_API_LIMITS = {
+    'cloudwatch': 10,
+    'xray': 4,
+    'logs': 10,
+    'tagging': 4,
+    'cloudtrail': 1
+}
+
+
+def api_limits_from_env():
+    """Per-API limits, overridable with e.g. TEST_CONCURRENCY_XRAY=2"""
+    return {
+        api: int(os.environ.get(f"TEST_CONCURRENCY_{api.upper()}", limit))
+        for api, limit in DEFAULT_API_LIMITS.items()
+    }
+
+
+class TestExecutor:
+    """
+    Runs test cases concurrently, on one thread pool per AWS API.
+
+    The pool of an API has as many threads as its limit, so no API sees more concurrent
+    cases than that, and a long queue of cases for one API never holds up the others.
+    Results come back in submission order whatever order the cases finish in; a case
+    that raises counts as failed.
+    """
+
+    def __init__(self, api_limits=None, default_limit=4):
+        self.api_limits = api_limits or DEFAULT_API_LIMITS
+        self.default_limit = default_limit
+
+    def run(self, jobs):
+        """
+        jobs: list of (test_type, test_case, runner) where runner(test_case) returns passed.
+        Returns the list of passed flags, in the order of jobs.
+        """
+        pools = {}
+        try:
+            futures = []
+            for job in jobs:
+                api = TEST_TYPE_APIS.get(job[0], 'default')
+                if api not in pools:
+                    pools[api] = ThreadPoolExecutor(
+                        max_workers=self.api_limits.get(api, self.default_limit),
+                        thread_name_prefix=f"test-{api}"
+                    )
+                futures.append(pools[api].submit(self._run_job, *job))
+            return [future.result() for future in futures]
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=False)
+
+    def _run_job(self, test_type, test_case, runner):
+        test_id = test_case.get('test_case_id', 'unknown')
+        start = time.time()
+        try:
+            return bool(runner(test_case))
+        except Exception as e:
+            print(f"Test case {test_id} ({test_type}) raised: {str(e)}")
+            return False
+        finally:
+            print(f"Test case {test_id} ({test_type}) finished in {time.time() - start:.1f}s")
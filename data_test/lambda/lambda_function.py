@@ -2,13 +2,15 @@ import json
 import boto3
 from datetime import datetime, timedelta, timezone
 import os
-import time
-from metrics_tester import run_test as run_metric_test
-from traces_tester import run_test as run_trace_test
-from logs_tester import run_test as run_logs_test
+from metrics_tester import MetricDataBatch, run_test as run_metric_test
+from traces_tester import TraceFetcher, run_test as run_trace_test
+from logs_tester import LogsQueryBatch, run_test as run_logs_test
 from tags_tester import run_test as run_tag_test
 from otel_resource_attributes_tester import run_test as run_otel_resource_attributes_test
 from cloudtrail_tester import run_test as run_cloudtrail_test
+from executor import TestExecutor, api_limits_from_env
+from result_publisher import publisher_from_env
+from logs_scheduler import LogsQueryScheduler
 
 
 # initialize aws clients
@@ -96,28 +98,17 @@ def execute_logs_test(test_case):
     """execute logs test"""
     start_dt, end_dt = get_time_range_params(test_case, 'logs')
     
-    try:
-        response = logs.start_query(
-            logGroupNames=test_case["log_group_names"],
-            startTime=int(start_dt.timestamp() * 1000),
-            endTime=int(end_dt.timestamp() * 1000),
-            queryString=test_case["query_string"]
-        )
-        
-        query_id = response['queryId']
-        
-        while True:
-            query_status = logs.get_query_results(queryId=query_id)
-            if query_status['status'] == 'Complete':
-                return query_status
-            elif query_status['status'] in ['Failed', 'Cancelled']:
-                print(f"Failed to execute logs test: {query_status['status']}")
-                return None
-            
-        return query_status
-    except Exception as e:
-        print(f"Failed to execute logs test: {str(e)}")
-        return None
+    responses = []
+    scheduler = LogsQueryScheduler(logs)
+    scheduler.submit(
+        responses.append,
+        logGroupNames=test_case["log_group_names"],
+        startTime=int(start_dt.timestamp() * 1000),
+        endTime=int(end_dt.timestamp() * 1000),
+        queryString=test_case["query_string"]
+    )
+    scheduler.run()
+    return responses[0] if responses else None
 
 def validate_metric_test(response, test_case):
     """validate metric test result"""
@@ -150,11 +141,18 @@ def validate_metric_test(response, test_case):
     
     return all(all_results)
 
-def validate_trace_test(response, test_case):
+def validate_trace_test(response, test_case, fetcher=None):
     """validate trace test result"""
     if not response:
         return False
         
+    if fetcher is None:
+        fetcher = TraceFetcher(xray, max_workers=1)
+        try:
+            return validate_trace_test(response, test_case, fetcher)
+        finally:
+            fetcher.close()
+        
     validation_checks = test_case.get("validation_checks", [])
     all_results = []
     
@@ -170,12 +168,9 @@ def validate_trace_test(response, test_case):
             metadata_key = check.get("metadata_key")
             found = False
             
-            for trace in response.get("TraceSummaries", []):
-                trace_ids = [trace.get("Id")]
-                trace_details = xray.batch_get_traces(TraceIds=trace_ids)
-                
-                for segment in trace_details.get("Traces", [])[0].get("Segments", []):
-                    document = json.loads(segment.get("Document"))
+            trace_ids = [trace.get("Id") for trace in response.get("TraceSummaries", [])]
+            for _, documents in fetcher.iter_documents(trace_ids):
+                for document in documents:
                     metadata = document.get("metadata", {})
                     if metadata_key in metadata:
                         found = True
@@ -190,12 +185,9 @@ def validate_trace_test(response, test_case):
             expected_message = check.get("expected")
             found = False
             
-            for trace in response.get("TraceSummaries", []):
-                trace_ids = [trace.get("Id")]
-                trace_details = xray.batch_get_traces(TraceIds=trace_ids)
-                
-                for segment in trace_details.get("Traces", [])[0].get("Segments", []):
-                    document = json.loads(segment.get("Document"))
+            trace_ids = [trace.get("Id") for trace in response.get("TraceSummaries", [])]
+            for _, documents in fetcher.iter_documents(trace_ids):
+                for document in documents:
                     cause = document.get("cause", {})
                     exceptions = cause.get("exceptions", {})
                     for exception in exceptions:
@@ -245,27 +237,6 @@ def validate_logs_test(response, test_case):
     
     return all(all_results)
 
-def publish_test_result(test_case, test_type, passed):
-    """publish test result to cloudwatch metrics"""
-    try:
-        cloudwatch.put_metric_data(
-            Namespace='APMTestResults',
-            MetricData=[
-                {
-                    'MetricName': 'TestResult',
-                    'Value': 1 if passed else 0,
-                    'Unit': 'Count',
-                    'Dimensions': [
-                        {'Name': 'TestType', 'Value': test_type},
-                        {'Name': 'TestCaseId', 'Value': test_case.get('test_case_id', 'unknown')},
-                        {'Name': 'TestScenario', 'Value': test_case.get('test_scenario', 'unknown')}
-                    ]
-                }
-            ]
-        )
-    except Exception as e:
-        print(f"Failed to publish test result: {str(e)}")
-
 def run_test(test_case, test_type):
     """run single test case"""
     response = None
@@ -281,7 +252,6 @@ def run_test(test_case, test_type):
         response = execute_logs_test(test_case)
         passed = validate_logs_test(response, test_case)
     
-    publish_test_result(test_case, test_type, passed)
     return passed
 
 def load_test_cases_from_files():
@@ -390,6 +360,7 @@ def lambda_handler(event, context):
         'cloudtrail': ('cloudtrail_test_cases', run_cloudtrail_test)
     }
     
+    jobs = []
     for test_type, (test_list_key, test_runner) in test_type_mapping.items():
         test_list = test_cases[test_type].get(test_list_key, [])
         results[test_type]['total'] = len(test_list)
@@ -402,11 +373,34 @@ def lambda_handler(event, context):
                 print(f"SKIPPING disabled test: {test_id} - {test_case.get('description', 'no description')}")
                 continue
                 
-            passed = test_runner(test_case)
-            publish_test_result(test_case, test_type, passed)
+            jobs.append((test_type, test_case, test_runner))
+    
+    # metric cases share their GetMetricData calls, logs cases their query scheduler and
+    # trace cases the segment documents fetched during this run
+    trace_fetcher = TraceFetcher()
+    batch_runners = {
+        'metrics': MetricDataBatch([test_case for test_type, test_case, _ in jobs if test_type == 'metrics']).run_test,
+        'logs': LogsQueryBatch([test_case for test_type, test_case, _ in jobs if test_type == 'logs']).run_test,
+        'traces': lambda test_case: run_trace_test(test_case, trace_fetcher)
+    }
+    jobs = [
+        (test_type, test_case, batch_runners.get(test_type, test_runner))
+        for test_type, test_case, test_runner in jobs
+    ]
+    
+    # cases run concurrently, results are tallied in job order
+    executor = TestExecutor(api_limits=api_limits_from_env())
+    publisher = publisher_from_env()
+    try:
+        for (test_type, test_case, _), passed in zip(jobs, executor.run(jobs)):
+            publisher.record(test_case, test_type, passed)
             
             if passed:
                 results[test_type]['passed'] += 1
+    finally:
+        # every result of the run goes out once, even when a case broke the run
+        print(f"Published {publisher.flush()} test results")
+        trace_fetcher.close()
     
     for test_type, result in results.items():
         print(f"\n{test_type} test summary:")
@@ -0,0 +1,142 @@
+import os
+import random
+import time
+
+# Logs Insights runs at most 30 concurrent queries per account, dashboards included
+DEFAULT_MAX_CONCURRENT = int(os.environ.get('LOGS_QUERY_CONCURRENCY', 10))
+DEFAULT_TIMEOUT = float(os.environ.get('LOGS_QUERY_TIMEOUT_SECONDS', 240))
+
+TERMINAL_STATUSES = ('Complete', 'Failed', 'Cancelled', 'Timeout')
+THROTTLING_ERRORS = ('LimitExceededException', 'ThrottlingException')
+
+
+class _Query:
+    def __init__(self, params, on_complete):
+        self.params = params
+        self.on_complete = on_complete
+        self.query_id = None
+        self.delay = 0
+        self.next_poll = 0
+
+
+class LogsQueryScheduler:
+    """
+    Runs many Logs Insights queries at once.
+
+    Queries are started up to max_concurrent at a time, a start that is throttled is
+    retried later. Each running query is polled with exponential backoff, from
+    initial_delay doubling up to max_delay, and its on_complete callback gets the
+    get_query_results response as soon as it is Complete, or None when it failed.
+    Queries still running `timeout` seconds after run() started are stopped and
+    reported as None, as are those that never got to start.
+    """
+
+    def __init__(self, client, max_concurrent=DEFAULT_MAX_CONCURRENT, timeout=DEFAULT_TIMEOUT,
+                 initial_delay=0.5, max_delay=5, clock=time.monotonic, sleep=time.sleep):
+        self.client = client
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self._pending = []
+        self._running = []
+
+    def submit(self, on_complete, **start_query_params):
+        """Queue a query, start_query_params are passed to logs.start_query"""
+        self._pending.append(_Query(start_query_params, on_complete))
+
+    def run(self):
+        """Run the queued queries, returns once every callback has been called"""
+        deadline = self.clock() + self.timeout
+        start_delay = self.initial_delay
+        next_start = 0
+        while self._pending or self._running:
+            now = self.clock()
+            if now >= deadline:
+                self._cancel_all()
+                return
+
+            if now >= next_start:
+                if self._start_pending(now):
+                    start_delay = self.initial_delay
+                else:
+                    next_start = now + start_delay
+                    start_delay = min(start_delay * 2, self.max_delay)
+
+            for query in [q for q in self._running if q.next_poll <= now]:
+                self._poll(query, now)
+
+            if not self._pending and not self._running:
+                return
+            wake_up = min([q.next_poll for q in self._running] + [deadline])
+            if self._pending and len(self._running) < self.max_concurrent:
+                wake_up = min(wake_up, next_start)
+            self.sleep(max(0, wake_up - self.clock()))
+
+    def _start_pending(self, now):
+        """Start queries while there is room, False when Logs throttled a start"""
+        while self._pending and len(self._running) < self.max_concurrent:
+            query = self._pending[0]
+            try:
+                query.query_id = self.client.start_query(**query.params)['queryId']
+            except Exception as e:
+                if _error_code(e) in THROTTLING_ERRORS:
+                    return False
+                self._pending.pop(0)
+                print(f"Failed to start logs query: {str(e)}")
+                self._complete(query, None)
+                continue
+            self._pending.pop(0)
+            query.delay = self.initial_delay
+            query.next_poll = now + query.delay
+            self._running.append(query)
+        return True
+
+    def _poll(self, query, now):
+        try:
+            response = self.client.get_query_results(queryId=query.query_id)
+        except Exception as e:
+            if _error_code(e) not in THROTTLING_ERRORS:
+                print(f"Failed to get logs query results: {str(e)}")
+                self._running.remove(query)
+                self._complete(query, None)
+                return
+            response = {'status': 'Throttled'}
+
+        status = response['status']
+        if status in TERMINAL_STATUSES:
+            self._running.remove(query)
+            if status != 'Complete':
+                print(f"Query failed with status: {status}")
+            self._complete(query, response if status == 'Complete' else None)
+            return
+        # jitter keeps queries started together from being polled together
+        query.delay = min(query.delay * 2, self.max_delay)
+        query.next_poll = now + query.delay * random.uniform(0.8, 1.2)
+
+    def _cancel_all(self):
+        for query in self._running:
+            try:
+                self.client.stop_query(queryId=query.query_id)
+            except Exception as e:
+                print(f"Failed to stop logs query {query.query_id}: {str(e)}")
+            print(f"Logs query {query.query_id} stopped, still running after {self.timeout:g}s")
+            self._complete(query, None)
+        for query in self._pending:
+            print(f"Logs query not started within {self.timeout:g}s")
+            self._complete(query, None)
+        self._running = []
+        self._pending = []
+
+    def _complete(self, query, response):
+        try:
+            query.on_complete(response)
+        except Exception as e:
+            print(f"Failed to handle logs query result: {str(e)}")
+
+
+def _error_code(error):
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code')
@@ -1,5 +1,6 @@
-import boto3, os
+import boto3, os, threading
 from datetime import datetime, timedelta, timezone
+from logs_scheduler import LogsQueryScheduler
 
 logs = boto3.client('logs')
 
@@ -14,8 +15,8 @@ def get_time_range_params(params):
     start_dt = end_dt - timedelta(minutes=int(relative_minutes))
     return start_dt, end_dt
 
-def execute_test(test_case):
-    """Execute logs test"""
+def build_query_params(test_case):
+    """start_query parameters of a logs test case"""
     start_dt, end_dt = get_time_range_params(test_case)
     
     # Process log group names to replace EKS_CLUSTER_PLACEHOLDER
@@ -23,28 +24,20 @@ def execute_test(test_case):
     for log_group in test_case["log_group_names"]:
         processed_log_groups.append(log_group.replace('EKS_CLUSTER_PLACEHOLDER', eks_cluster_name))
     
-    try:
-        response = logs.start_query(
-            logGroupNames=processed_log_groups,
-            startTime=int(start_dt.timestamp() * 1000),
-            endTime=int(end_dt.timestamp() * 1000),
-            queryString=test_case["query_string"].replace('ENVIRONMENT_NAME_PLACEHOLDER', environment_name)
-        )
-        
-        query_id = response['queryId']
-        
-        while True:
-            query_status = logs.get_query_results(queryId=query_id)
-            if query_status['status'] == 'Complete':
-                return query_status
-            elif query_status['status'] in ['Failed', 'Cancelled']:
-                print(f"Query failed with status: {query_status['status']}")
-                return None
-            
-        return query_status
-    except Exception as e:
-        print(f"Failed to execute logs query: {str(e)}")
-        return None
+    return {
+        'logGroupNames': processed_log_groups,
+        'startTime': int(start_dt.timestamp() * 1000),
+        'endTime': int(end_dt.timestamp() * 1000),
+        'queryString': test_case["query_string"].replace('ENVIRONMENT_NAME_PLACEHOLDER', environment_name)
+    }
+
+def execute_test(test_case):
+    """Execute logs test"""
+    responses = []
+    scheduler = LogsQueryScheduler(logs)
+    scheduler.submit(responses.append, **build_query_params(test_case))
+    scheduler.run()
+    return responses[0] if responses else None
 
 def validate_test(response, test_case):
     """Validate logs test result"""
@@ -84,4 +77,36 @@ def validate_test(response, test_case):
 def run_test(test_case):
     """Run single logs test case"""
     response = execute_test(test_case)
-    return validate_test(response, test_case) 
\ No newline at end of file
+    return validate_test(response, test_case) 
+
+class LogsQueryBatch:
+    """
+    Logs test cases of one run sharing a LogsQueryScheduler.
+
+    The first test case that runs starts the queries of all of them, each case is
+    validated as soon as its query completes, the others wait and read their result.
+    """
+
+    def __init__(self, test_cases):
+        self.test_cases = test_cases
+        self._passed = None
+        self._lock = threading.Lock()
+
+    def passed(self, test_case):
+        with self._lock:
+            if self._passed is None:
+                self._passed = {}
+                scheduler = LogsQueryScheduler(logs)
+                for case in self.test_cases:
+                    scheduler.submit(self._validator(case), **build_query_params(case))
+                scheduler.run()
+        return self._passed.get(id(test_case), False)
+
+    def _validator(self, test_case):
+        def on_complete(response):
+            self._passed[id(test_case)] = validate_test(response, test_case)
+        return on_complete
+
+    def run_test(self, test_case):
+        """Run single logs test case of the batch"""
+        return self.passed(test_case)
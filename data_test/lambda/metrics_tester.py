@@ -1,15 +1,18 @@
-import boto3, os
+import boto3, os, threading
 from datetime import datetime, timedelta, timezone
 
 cloudwatch = boto3.client('cloudwatch')
 
 environment_name = os.environ.get("ENV_NAME", "eks:eks-pet-clinic-demo/pet-clinic")
 
+# GetMetricData accepts up to 500 MetricDataQuery structures per call
+MAX_QUERIES_PER_CALL = 500
 
-def get_time_range_params(params):
+
+def get_time_range_params(params, end_dt=None):
     """Get time range params"""
     evaluation_period_minutes = params.get("evaluation_period_minutes", 5)
-    end_dt = datetime.now(timezone.utc)
+    end_dt = end_dt or datetime.now(timezone.utc)
     start_dt = end_dt - timedelta(minutes=evaluation_period_minutes)
     return start_dt, end_dt
 
@@ -45,69 +48,97 @@ def build_metric_expression(test_case):
 
     return expression
 
+def build_metric_query(test_case, query_id):
+    """Build the MetricDataQuery of a test case"""
+    period = test_case.get("period", 60)
+    if test_case.get("use_query_style", False):
+        return {
+            'Id': query_id,
+            'Expression': build_metric_expression(test_case),
+            'Period': period,
+            'ReturnData': True
+        }
+
+    # MetricStat mode - use all dimensions as-is, NO_VALIDATE is not supported
+    dimensions = []
+    for dim in test_case.get("dimensions", []):
+        if isinstance(dim.get("Value"), str) and 'ENVIRONMENT_NAME_PLACEHOLDER' in dim["Value"]:
+            dim = dict(dim, Value=dim["Value"].replace('ENVIRONMENT_NAME_PLACEHOLDER', environment_name))
+        dimensions.append(dim)
+    return {
+        'Id': query_id,
+        'MetricStat': {
+            'Metric': {
+                'Namespace': test_case["metric_namespace"],
+                'MetricName': test_case["metric_name"],
+                'Dimensions': dimensions
+            },
+            'Period': period,
+            'Stat': test_case["statistic"]
+        },
+        'ReturnData': True
+    }
+
+def fetch_metric_data(test_cases):
+    """
+    Get the metric data of many test cases in as few GetMetricData calls as possible.
+
+    Cases with the same time window and period share calls of up to MAX_QUERIES_PER_CALL
+    queries, results are mapped back by query Id and merged across NextToken pages.
+    Returns one response per test case, in order, None when its query failed.
+    """
+    end_dt = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    groups = {}
+    for index, test_case in enumerate(test_cases):
+        start_dt, _ = get_time_range_params(test_case, end_dt)
+        key = (start_dt, test_case.get("period", 60))
+        groups.setdefault(key, []).append(index)
+
+    responses = [None] * len(test_cases)
+    for (start_dt, _), indexes in groups.items():
+        for i in range(0, len(indexes), MAX_QUERIES_PER_CALL):
+            batch = indexes[i:i + MAX_QUERIES_PER_CALL]
+            queries = [build_metric_query(test_cases[index], f"m{index}") for index in batch]
+            values = get_metric_data_isolated(queries, start_dt, end_dt)
+            for index, query in zip(batch, queries):
+                if values[query['Id']] is not None:
+                    responses[index] = {"MetricDataResults": [{"Id": query['Id'], "Values": values[query['Id']]}]}
+    return responses
+
+def get_metric_data_isolated(queries, start_dt, end_dt):
+    """
+    Values per query Id of one batch, None for the queries that could not be fetched.
+
+    A failed call is retried in halves, so one bad query (an invalid expression, say)
+    only fails its own test case instead of the whole batch.
+    """
+    try:
+        return get_metric_data_pages(queries, start_dt, end_dt)
+    except Exception as e:
+        if len(queries) == 1:
+            print(f"Failed to get metric data for query {queries[0]['Id']}: {str(e)}")
+            return {queries[0]['Id']: None}
+        print(f"Failed to get metric data for {len(queries)} test cases, retrying in halves: {str(e)}")
+        half = len(queries) // 2
+        values = get_metric_data_isolated(queries[:half], start_dt, end_dt)
+        values.update(get_metric_data_isolated(queries[half:], start_dt, end_dt))
+        return values
+
+def get_metric_data_pages(queries, start_dt, end_dt):
+    """Values per query Id, over all pages of one GetMetricData request"""
+    values = {query['Id']: [] for query in queries}
+    params = {'StartTime': start_dt, 'EndTime': end_dt, 'MetricDataQueries': queries}
+    while True:
+        response = cloudwatch.get_metric_data(**params)
+        for result in response.get("MetricDataResults", []):
+            values[result["Id"]].extend(result.get("Values", []))
+        if not response.get("NextToken"):
+            return values
+        params['NextToken'] = response["NextToken"]
+
 def execute_test(test_case):
     """Execute metric test"""
-    start_dt, end_dt = get_time_range_params(test_case)
-    
-    use_query_style = test_case.get("use_query_style", False)
-    
-    if use_query_style:
-        expression = build_metric_expression(test_case)
-        try:
-            response = cloudwatch.get_metric_data(
-                StartTime=start_dt,
-                EndTime=end_dt,
-                MetricDataQueries=[
-                    {
-                        'Id': 'm1',
-                        'Expression': expression,
-                        'Period': 60,
-                        'ReturnData': True
-                    }
-                ]
-            )
-            return response
-        except Exception as e:
-            print(f"Failed to get metric data with Expression: {str(e)}")
-            return None
-    else:
-        # MetricStat mode - use all dimensions as-is, NO_VALIDATE is not supported
-        dimensions = test_case.get("dimensions", [])
-
-        new_dimensions = []
-        for dim in dimensions:
-            if isinstance(dim.get("Value"), str) and 'ENVIRONMENT_NAME_PLACEHOLDER' in dim["Value"]:
-                new_dim = dim.copy()
-                new_dim["Value"] = dim["Value"].replace('ENVIRONMENT_NAME_PLACEHOLDER', environment_name)
-                new_dimensions.append(new_dim)
-            else:
-                new_dimensions.append(dim)
-        dimensions = new_dimensions
-        
-        try:
-            response = cloudwatch.get_metric_data(
-                StartTime=start_dt,
-                EndTime=end_dt,
-                MetricDataQueries=[
-                    {
-                        'Id': 'm1',
-                        'MetricStat': {
-                            'Metric': {
-                                'Namespace': test_case["metric_namespace"],
-                                'MetricName': test_case["metric_name"],
-                                'Dimensions': dimensions
-                            },
-                            'Period': 60,
-                            'Stat': test_case["statistic"]
-                        },
-                        'ReturnData': True
-                    }
-                ]
-            )
-            return response
-        except Exception as e:
-            print(f"Failed to get metric data with MetricStat: {str(e)}")
-            return None
+    return fetch_metric_data([test_case])[0]
 
 def validate_test(response, test_case):
     """Validate metric test result"""
@@ -147,4 +178,28 @@ def validate_test(response, test_case):
 def run_test(test_case):
     """Run single metric test case"""
     response = execute_test(test_case)
-    return validate_test(response, test_case) 
\ No newline at end of file
+    return validate_test(response, test_case) 
+
+class MetricDataBatch:
+    """
+    Metric test cases of one run sharing their GetMetricData calls.
+
+    The first test case that runs fetches the data of all of them, the others wait for it
+    and validate against their own result.
+    """
+
+    def __init__(self, test_cases):
+        self.test_cases = test_cases
+        self._responses = None
+        self._lock = threading.Lock()
+
+    def response_for(self, test_case):
+        with self._lock:
+            if self._responses is None:
+                responses = fetch_metric_data(self.test_cases)
+                self._responses = {id(case): response for case, response in zip(self.test_cases, responses)}
+        return self._responses.get(id(test_case))
+
+    def run_test(self, test_case):
+        """Run single metric test case of the batch"""
+        return validate_test(self.response_for(test_case), test_case)
@@ -3,10 +3,11 @@ import json
 import time
 from datetime import datetime, timedelta, timezone
 
+logs_client = boto3.client('logs')
+
 def execute_test(test_case):
     """Execute OTEL resource attributes test"""
-    logs_client = boto3.client('logs')
-    
+
     service_name = test_case["service_name"]
     time_range_minutes = test_case.get("time_range_minutes", 60)
     
@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+import time
+
+import boto3
+
+NAMESPACE = 'APMTestResults'
+DIMENSIONS = ['TestType', 'TestCaseId', 'TestScenario']
+
+# PutMetricData accepts up to 1000 metrics per request
+MAX_DATUMS_PER_CALL = 1000
+
+
+class EmfSink:
+    """
+    Writes results as CloudWatch Embedded Metric Format lines, Lambda's log agent turns
+    them into metrics without any API call. Every result has its own dimension values,
+    so each one is its own document.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def publish(self, results):
+        lines = []
+        for result in results:
+            lines.append(json.dumps({
+                '_aws': {
+                    'Timestamp': result['timestamp'],
+                    'CloudWatchMetrics': [{
+                        'Namespace': NAMESPACE,
+                        'Dimensions': [DIMENSIONS],
+                        'Metrics': [{'Name': 'TestResult', 'Unit': 'Count'}]
+                    }]
+                },
+                'TestType': result['test_type'],
+                'TestCaseId': result['test_case_id'],
+                'TestScenario': result['test_scenario'],
+                'TestResult': 1 if result['passed'] else 0
+            }))
+        if lines:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+
+
+class PutMetricDataSink:
+    """Sends results with PutMetricData, MAX_DATUMS_PER_CALL per request"""
+
+    def __init__(self, cloudwatch=None):
+        self.cloudwatch = cloudwatch or boto3.client('cloudwatch')
+
+    def publish(self, results):
+        datums = [
+            {
+                'MetricName': 'TestResult',
+                'Value': 1 if result['passed'] else 0,
+                'Unit': 'Count',
+                'Timestamp': result['timestamp'] / 1000,
+                'Dimensions': [
+                    {'Name': 'TestType', 'Value': result['test_type']},
+                    {'Name': 'TestCaseId', 'Value': result['test_case_id']},
+                    {'Name': 'TestScenario', 'Value': result['test_scenario']}
+                ]
+            }
+            for result in results
+        ]
+        for i in range(0, len(datums), MAX_DATUMS_PER_CALL):
+            try:
+                self.cloudwatch.put_metric_data(Namespace=NAMESPACE, MetricData=datums[i:i + MAX_DATUMS_PER_CALL])
+            except Exception as e:
+                print(f"Failed to publish {len(datums[i:i + MAX_DATUMS_PER_CALL])} test results: {str(e)}")
+
+
+class FileSink:
+    """Appends results as JSON lines to a local file, for offline runs"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def publish(self, results):
+        with open(self.path, 'a') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+
+
+class ResultPublisher:
+    """
+    Buffers the test results of a run and publishes them once, on flush.
+
+    A result is keyed by test type, test case id and scenario, recording the same case
+    again replaces its earlier result so every case is published exactly once per run.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self._results = {}
+
+    def record(self, test_case, test_type, passed):
+        result = {
+            'test_type': test_type,
+            'test_case_id': test_case.get('test_case_id', 'unknown'),
+            'test_scenario': test_case.get('test_scenario', 'unknown'),
+            'passed': bool(passed),
+            'timestamp': int(time.time() * 1000)
+        }
+        key = (result['test_type'], result['test_case_id'], result['test_scenario'])
+        self._results.pop(key, None)
+        self._results[key] = result
+
+    def flush(self):
+        results = list(self._results.values())
+        self._results.clear()
+        if results:
+            self.sink.publish(results)
+        return len(results)
+
+
+def publisher_from_env():
+    """
+    TEST_RESULT_SINK picks where results go: emf (default), put_metric_data or file,
+    the file sink writes to TEST_RESULT_FILE.
+    """
+    sink = os.environ.get('TEST_RESULT_SINK', 'emf').lower()
+    if sink == 'put_metric_data':
+        return ResultPublisher(PutMetricDataSink())
+    if sink == 'file':
+        return ResultPublisher(FileSink(os.environ.get('TEST_RESULT_FILE', 'test_results.jsonl')))
+    return ResultPublisher(EmfSink())
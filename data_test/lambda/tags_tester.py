@@ -1,23 +1,28 @@
 import boto3
 import json
+from functools import lru_cache
+
+lambda_client = boto3.client('lambda')
+apigateway_client = boto3.client('apigateway')
+sts = boto3.client('sts')
+
+@lru_cache(maxsize=None)
+def get_account_id():
+    return sts.get_caller_identity()['Account']
 
 def execute_test(test_case):
     """Execute tag test"""
     resource_type = test_case.get('resource_type')
     resource_name = test_case.get('resource_name')
     
-    session = boto3.Session()
-    
     if resource_type == 'lambda':
-        lambda_client = session.client('lambda')
         try:
-            response = lambda_client.list_tags(Resource=f"arn:aws:lambda:{lambda_client.meta.region_name}:{boto3.client('sts').get_caller_identity()['Account']}:function:{resource_name}")
+            response = lambda_client.list_tags(Resource=f"arn:aws:lambda:{lambda_client.meta.region_name}:{get_account_id()}:function:{resource_name}")
             return response.get('Tags', {})
         except Exception as e:
             print(f"Failed to get Lambda tags for {resource_name}: {str(e)}")
             return {}
     elif resource_type == 'apigateway':
-        apigateway_client = session.client('apigateway')
         try:
             apis = apigateway_client.get_rest_apis()
             api_id = None
@@ -1,11 +1,92 @@
 import json
 import os
+import threading
 import boto3
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 
 environment_name = os.environ.get("ENV_NAME", "eks:eks-pet-clinic-demo/pet-clinic")
 
 xray = boto3.client('xray')
+sts = boto3.client('sts')
+
+# BatchGetTraces accepts up to 5 trace ids per call
+TRACE_IDS_PER_CALL = 5
+
+@lru_cache(maxsize=None)
+def get_account_id():
+    return sts.get_caller_identity()['Account']
+
+class TraceFetcher:
+    """
+    Parsed segment documents of traces, shared by all checks and test cases of a run.
+
+    Trace ids are fetched TRACE_IDS_PER_CALL at a time, the batches run in parallel on
+    max_workers threads, which also caps the concurrent BatchGetTraces calls of the run.
+    Each trace is fetched and parsed once, test cases asking for a trace that another one
+    is fetching wait for that fetch.
+    """
+
+    def __init__(self, client=None, max_workers=4):
+        self.client = client or xray
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='trace-fetch')
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def iter_documents(self, trace_ids):
+        """
+        Yields (trace_id, segment documents) in order, fetching a few batches ahead,
+        so a check that stops early does not fetch every trace.
+        """
+        wave = TRACE_IDS_PER_CALL * self.max_workers
+        for i in range(0, len(trace_ids), wave):
+            chunk = trace_ids[i:i + wave]
+            documents = self.documents(chunk)
+            for trace_id in chunk:
+                yield trace_id, documents[trace_id]
+
+    def documents(self, trace_ids):
+        """Segment documents per trace id, fetching the ones not cached yet"""
+        futures = {}
+        missing = []
+        with self._lock:
+            for trace_id in dict.fromkeys(trace_ids):
+                future = self._documents.get(trace_id)
+                if future is None:
+                    future = self._documents[trace_id] = Future()
+                    missing.append(trace_id)
+                futures[trace_id] = future
+        batches = [missing[i:i + TRACE_IDS_PER_CALL] for i in range(0, len(missing), TRACE_IDS_PER_CALL)]
+        for _ in self._pool.map(self._fetch, batches):
+            pass
+        return {trace_id: future.result() for trace_id, future in futures.items()}
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+    def _fetch(self, trace_ids):
+        try:
+            documents = {trace_id: [] for trace_id in trace_ids}
+            params = {'TraceIds': trace_ids}
+            while True:
+                response = self.client.batch_get_traces(**params)
+                for trace in response.get("Traces", []):
+                    documents.setdefault(trace.get("Id"), []).extend(
+                        json.loads(segment.get("Document")) for segment in trace.get("Segments", [])
+                    )
+                if not response.get("NextToken"):
+                    break
+                params['NextToken'] = response["NextToken"]
+        except Exception as e:
+            with self._lock:
+                for trace_id in trace_ids:
+                    # not cached, a later check retries
+                    self._documents.pop(trace_id).set_exception(e)
+            return
+        for trace_id in trace_ids:
+            self._documents[trace_id].set_result(documents[trace_id])
 
 def get_time_range_params(params):
     """Get time range params"""
@@ -28,8 +109,7 @@ def execute_test(test_case):
             
             # Check if ACCOUNT_ID_PLACEHOLDER exists in filter expression and replace it
             if "ACCOUNT_ID_PLACEHOLDER" in filter_expression:
-                client = boto3.client('sts')
-                account_id = client.get_caller_identity()['Account']
+                account_id = get_account_id()
                 filter_expression = filter_expression.replace('ACCOUNT_ID_PLACEHOLDER', account_id)
             
             # Check if REGION_NAME_PLACEHOLDER exists in filter expression and replace it
@@ -61,11 +141,18 @@ def execute_test(test_case):
         print(f"Failed to get trace summaries: {str(e)}")
         return None
 
-def validate_test(response, test_case):
-    """Validate trace test result"""
+def validate_test(response, test_case, fetcher=None):
+    """Validate trace test result, segment documents come from fetcher, a run's shared TraceFetcher"""
     if not response:
         return False
         
+    if fetcher is None:
+        fetcher = TraceFetcher(max_workers=1)
+        try:
+            return validate_test(response, test_case, fetcher)
+        finally:
+            fetcher.close()
+        
     validation_checks = test_case.get("validation_checks", [])
     all_results = []
     
@@ -82,12 +169,9 @@ def validate_test(response, test_case):
             metadata_key = check.get("metadata_key")
             found = False
             
-            for trace in response.get("TraceSummaries", []):
-                trace_ids = [trace.get("Id")]
-                trace_details = xray.batch_get_traces(TraceIds=trace_ids)
-                
-                for segment in trace_details.get("Traces", [])[0].get("Segments", []):
-                    document = json.loads(segment.get("Document"))
+            trace_ids = [trace.get("Id") for trace in response.get("TraceSummaries", [])]
+            for _, documents in fetcher.iter_documents(trace_ids):
+                for document in documents:
                     metadata = document.get("metadata", {})
                     if metadata_key in metadata:
                         found = True
@@ -102,12 +186,9 @@ def validate_test(response, test_case):
             expected_message = check.get("expected")
             found = False
             
-            for trace in response.get("TraceSummaries", []):
-                trace_ids = [trace.get("Id")]
-                trace_details = xray.batch_get_traces(TraceIds=trace_ids)
-                
-                for segment in trace_details.get("Traces", [])[0].get("Segments", []):
-                    document = json.loads(segment.get("Document"))
+            trace_ids = [trace.get("Id") for trace in response.get("TraceSummaries", [])]
+            for _, documents in fetcher.iter_documents(trace_ids):
+                for document in documents:
                     cause = document.get("cause", {})
                     exceptions = cause.get("exceptions", {})
                     for exception in exceptions:
@@ -124,7 +205,7 @@ def validate_test(response, test_case):
     
     return all(all_results)
 
-def run_test(test_case):
+def run_test(test_case, fetcher=None):
     """Run single trace test case"""
     response = execute_test(test_case)
-    return validate_test(response, test_case) 
\ No newline at end of file
+    return validate_test(response, test_case, fetcher) 
\ No newline at end of file
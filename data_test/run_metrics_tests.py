@@ -8,6 +8,9 @@ from datetime import datetime, timedelta, timezone
 
 environment_name = os.environ.get("ENV_NAME", "eks:eks-pet-clinic-demo/pet-clinic")
 
+# GetMetricData accepts up to 500 MetricDataQuery structures per call
+MAX_QUERIES_PER_CALL = 500
+
 def load_test_cases(json_file_path):
     try:
         with open(json_file_path, 'r') as f:
@@ -20,9 +23,9 @@ def load_test_cases(json_file_path):
         print(f"ERROR: JSON File Phase Error {json_file_path}: {e}", file=sys.stderr)
         sys.exit(1)
 
-def get_time_range_params(test_case):
+def get_time_range_params(test_case, end_dt=None):
     evaluation_period_minutes = test_case.get("evaluation_period_minutes", 5)
-    end_dt = datetime.now(timezone.utc)
+    end_dt = end_dt or datetime.now(timezone.utc)
     start_dt = end_dt - timedelta(minutes=evaluation_period_minutes)
     return start_dt, end_dt
 
@@ -111,36 +114,18 @@ def build_metric_expression(test_case):
     
     return expression
 
-def execute_metric_test_with_expression(test_case, start_dt, end_dt):
-    """Execute metric test using CloudWatch Metrics Insights Expression format"""
-    session = boto3.Session()
-    cloudwatch = session.client('cloudwatch')
+def build_metric_query(test_case, query_id):
+    """Build the MetricDataQuery of a test case, as an Expression or the original MetricStat"""
+    period = test_case.get("period", 60)
     
-    # Build the metric expression
-    expression = build_metric_expression(test_case)
-    
-    try:
-        response = cloudwatch.get_metric_data(
-            StartTime=start_dt,
-            EndTime=end_dt,
-            MetricDataQueries=[
-                {
-                    'Id': 'm1',
-                    'Expression': expression,
-                    'Period': 60,
-                    'ReturnData': True
-                }
-            ]
-        )
-        return response                
-    except Exception as e:
-        print(f"❌ Failed to get metric data with Expression: {str(e)}")
-        return None
-
-def execute_metric_test_with_metricstat(test_case, start_dt, end_dt):
-    """Execute metric test using original MetricStat format"""
-    session = boto3.Session()
-    cloudwatch = session.client('cloudwatch')
+    # Check if we should use query style (Expression) or original style (MetricStat)
+    if test_case.get("use_query_style", False):
+        return {
+            'Id': query_id,
+            'Expression': build_metric_expression(test_case),
+            'Period': period,
+            'ReturnData': True
+        }
         
     # MetricStat mode - use all dimensions as-is, NO_VALIDATE is not supported
     dimensions = test_case.get("dimensions", [])
@@ -154,73 +139,103 @@ def execute_metric_test_with_metricstat(test_case, start_dt, end_dt):
         else:
             new_dimensions.append(dim)
 
-    dimensions = new_dimensions
-    
+    return {
+        'Id': query_id,
+        'MetricStat': {
+            'Metric': {
+                'Namespace': test_case["metric_namespace"],
+                'MetricName': test_case["metric_name"],
+                'Dimensions': new_dimensions
+            },
+            'Period': period,
+            'Stat': test_case["statistic"]
+        },
+        'ReturnData': True
+    }
+
+def get_metric_data_pages(cloudwatch, queries, start_dt, end_dt):
+    """Values per query Id, over all NextToken pages of one GetMetricData request"""
+    values = {query['Id']: [] for query in queries}
+    params = {'StartTime': start_dt, 'EndTime': end_dt, 'MetricDataQueries': queries}
+    while True:
+        response = cloudwatch.get_metric_data(**params)
+        for result in response.get("MetricDataResults", []):
+            values[result["Id"]].extend(result.get("Values", []))
+        if not response.get("NextToken"):
+            return values
+        params['NextToken'] = response["NextToken"]
+
+def get_metric_data_isolated(cloudwatch, queries, start_dt, end_dt):
+    """
+    Values per query Id of one batch, None for the queries that could not be fetched,
+    and the number of requests made.
+
+    A failed request is retried in halves, so one bad query (an invalid expression, say)
+    only fails its own test case instead of the whole batch.
+    """
     try:
-        response = cloudwatch.get_metric_data(
-            StartTime=start_dt,
-            EndTime=end_dt,
-            MetricDataQueries=[
-                {
-                    'Id': 'm1',
-                    'MetricStat': {
-                        'Metric': {
-                            'Namespace': test_case["metric_namespace"],
-                            'MetricName': test_case["metric_name"],
-                            'Dimensions': dimensions
-                        },
-                        'Period': 60,
-                        'Stat': test_case["statistic"]
-                    },
-                    'ReturnData': True
-                }
-            ]
-        )
-        return response                
+        return get_metric_data_pages(cloudwatch, queries, start_dt, end_dt), 1
     except Exception as e:
-        print(f"❌ Failed to get metric data with MetricStat: {str(e)}")
-        return None
+        if len(queries) == 1:
+            print(f"❌ Failed to get metric data of {queries[0]['Id']} from {start_dt} to {end_dt}: {str(e)}")
+            return {queries[0]['Id']: None}, 1
+        print(f"⚠️ Failed to get metric data of {len(queries)} queries, retrying in halves: {str(e)}")
+        half = len(queries) // 2
+        values, first_calls = get_metric_data_isolated(cloudwatch, queries[:half], start_dt, end_dt)
+        second_values, second_calls = get_metric_data_isolated(cloudwatch, queries[half:], start_dt, end_dt)
+        values.update(second_values)
+        return values, 1 + first_calls + second_calls
 
-def execute_metric_test(test_case):
+def fetch_metric_data(test_cases):
+    """
+    Get the metric data of all test cases in as few GetMetricData calls as possible.
+    
+    Every test case becomes one query per time window, several windows when only
+    non-business hours are needed. Queries with the same window and period are sent
+    together, up to MAX_QUERIES_PER_CALL per call, and mapped back by their Id.
+    Returns one response per test case, in order, None when no data could be fetched.
+    """
     session = boto3.Session()
     cloudwatch = session.client('cloudwatch')
     
-    start_dt, end_dt = get_time_range_params(test_case)
-    
-    # Check if we should use query style (Expression) or original style (MetricStat)
-    use_query_style = test_case.get("use_query_style", False)
+    # One end time for the whole run, so cases with the same evaluation period share a window
+    end_dt = datetime.now(timezone.utc).replace(second=0, microsecond=0)
     
-    # Check if only non-business hours are needed
-    if test_case.get("non_business_hours_only", False):
-        non_business_ranges = get_non_business_hours_ranges(start_dt, end_dt)
-        if not non_business_ranges:
-            print("⚠️ No non-business time periods in the specified time range")
-            return None
+    groups = {}
+    for index, test_case in enumerate(test_cases):
+        start_dt, _ = get_time_range_params(test_case, end_dt)
+        windows = [(start_dt, end_dt)]
         
-        all_results = []
-        for range_start, range_end in non_business_ranges:
-            try:
-                if use_query_style:
-                    response = execute_metric_test_with_expression(test_case, range_start, range_end)
-                else:
-                    response = execute_metric_test_with_metricstat(test_case, range_start, range_end)
-                
-                if response and response.get("MetricDataResults"):
-                    all_results.extend(response["MetricDataResults"][0].get("Values", []))
-            except Exception as e:
-                print(f"❌ Failed to get metric data in non-business time period {range_start} to {range_end}: {str(e)}")
+        # Check if only non-business hours are needed
+        if test_case.get("non_business_hours_only", False):
+            windows = get_non_business_hours_ranges(start_dt, end_dt)
+            if not windows:
+                print(f"⚠️ No non-business time periods in the specified time range: {test_case.get('test_case_id', 'N/A')}")
         
-        # Merge all non-business time period results
-        if all_results:
-            print(f"✅ Successfully got metric data in non-business time periods")
-            return {"MetricDataResults": [{"Values": all_results}]}
-        return None
+        for window_index, window in enumerate(windows):
+            key = (window, test_case.get("period", 60))
+            query = build_metric_query(test_case, f"m{index}_{window_index}")
+            groups.setdefault(key, []).append((index, query))
     
-    # Execute based on the chosen style
-    if use_query_style:
-        return execute_metric_test_with_expression(test_case, start_dt, end_dt)
-    else:
-        return execute_metric_test_with_metricstat(test_case, start_dt, end_dt)
+    values = [None] * len(test_cases)
+    calls = 0
+    for ((start_dt, end_dt), _), queries in groups.items():
+        for i in range(0, len(queries), MAX_QUERIES_PER_CALL):
+            batch = queries[i:i + MAX_QUERIES_PER_CALL]
+            batch_values, batch_calls = get_metric_data_isolated(cloudwatch, [query for _, query in batch], start_dt, end_dt)
+            calls += batch_calls
+            for index, query in batch:
+                if batch_values[query['Id']] is None:
+                    continue
+                if values[index] is None:
+                    values[index] = []
+                values[index].extend(batch_values[query['Id']])
+    
+    print(f"Fetched metric data of {len(test_cases)} test cases in {calls} GetMetricData requests")
+    return [
+        {"MetricDataResults": [{"Values": case_values}]} if case_values is not None else None
+        for case_values in values
+    ]
 
 def execute_and_validate_command(response, test_case):
     if not response:
@@ -261,11 +276,10 @@ def execute_and_validate_command(response, test_case):
     
     print(f"Overall Result: {'✅ Passed' if all(all_results) else '❌ Failed'}")
 
-def run_test_case(test_case):
+def run_test_case(test_case, response):
     print(f"\n--- Execute Test Case: {test_case.get('test_case_id', 'N/A')} ---")
     print(f"Description: {test_case.get('description', 'N/A')}")
     
-    response = execute_metric_test(test_case)
     execute_and_validate_command(response, test_case)
     
     print("--- Test End ---\n")
@@ -294,11 +308,16 @@ def main():
         sys.exit(1)
     
     print("\nStart executing tests...")
+    enabled_test_cases = []
     for test_case in test_cases:
         if test_case.get('disabled', False):
             print(f"SKIPPING disabled test: {test_case.get('test_case_id', 'unknown')} - {test_case.get('description', 'no description')}")
             continue
-        run_test_case(test_case)
+        enabled_test_cases.append(test_case)
+    
+    responses = fetch_metric_data(enabled_test_cases)
+    for test_case, response in zip(enabled_test_cases, responses):
+        run_test_case(test_case, response)
     
     print("All test cases executed")
 
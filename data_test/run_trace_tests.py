@@ -2,11 +2,87 @@
 import json
 import sys
 import os
+import threading
 import boto3
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 environment_name = os.environ.get("ENV_NAME", "eks:eks-pet-clinic-demo/pet-clinic")
 
+# BatchGetTraces accepts up to 5 trace ids per call
+TRACE_IDS_PER_CALL = 5
+
+class TraceFetcher:
+    """
+    Parsed segment documents of traces, shared by all checks and test cases of a run.
+
+    Trace ids are fetched TRACE_IDS_PER_CALL at a time, the batches run in parallel on
+    max_workers threads, which also caps the concurrent BatchGetTraces calls of the run.
+    Each trace is fetched and parsed once, test cases asking for a trace that another one
+    is fetching wait for that fetch.
+    """
+
+    def __init__(self, client, max_workers=4):
+        self.client = client
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='trace-fetch')
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def iter_documents(self, trace_ids):
+        """
+        Yields (trace_id, segment documents) in order, fetching a few batches ahead,
+        so a check that stops early does not fetch every trace.
+        """
+        wave = TRACE_IDS_PER_CALL * self.max_workers
+        for i in range(0, len(trace_ids), wave):
+            chunk = trace_ids[i:i + wave]
+            documents = self.documents(chunk)
+            for trace_id in chunk:
+                yield trace_id, documents[trace_id]
+
+    def documents(self, trace_ids):
+        """Segment documents per trace id, fetching the ones not cached yet"""
+        futures = {}
+        missing = []
+        with self._lock:
+            for trace_id in dict.fromkeys(trace_ids):
+                future = self._documents.get(trace_id)
+                if future is None:
+                    future = self._documents[trace_id] = Future()
+                    missing.append(trace_id)
+                futures[trace_id] = future
+        batches = [missing[i:i + TRACE_IDS_PER_CALL] for i in range(0, len(missing), TRACE_IDS_PER_CALL)]
+        for _ in self._pool.map(self._fetch, batches):
+            pass
+        return {trace_id: future.result() for trace_id, future in futures.items()}
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+    def _fetch(self, trace_ids):
+        try:
+            documents = {trace_id: [] for trace_id in trace_ids}
+            params = {'TraceIds': trace_ids}
+            while True:
+                response = self.client.batch_get_traces(**params)
+                for trace in response.get("Traces", []):
+                    documents.setdefault(trace.get("Id"), []).extend(
+                        json.loads(segment.get("Document")) for segment in trace.get("Segments", [])
+                    )
+                if not response.get("NextToken"):
+                    break
+                params['NextToken'] = response["NextToken"]
+        except Exception as e:
+            with self._lock:
+                for trace_id in trace_ids:
+                    # not cached, a later check retries
+                    self._documents.pop(trace_id).set_exception(e)
+            return
+        for trace_id in trace_ids:
+            self._documents[trace_id].set_result(documents[trace_id])
+
+
 def load_test_cases(json_file_path):
     try:
         with open(json_file_path, 'r') as f:
@@ -90,7 +166,7 @@ def execute_trace_test(test_case):
         print(f"❌ Fail to get trace summaries: {str(e)}")
         return None
 
-def execute_and_validate_command(response, validation_checks):
+def execute_and_validate_command(response, validation_checks, fetcher):
     if not response:
         return
         
@@ -112,14 +188,9 @@ def execute_and_validate_command(response, validation_checks):
             metadata_key = check.get("metadata_key")
             found = False
             
-            for trace in response.get("TraceSummaries", []):
-                trace_ids = [trace.get("Id")]
-                session = boto3.Session()
-                xray = session.client('xray')
-                trace_details = xray.batch_get_traces(TraceIds=trace_ids)
-                
-                for segment in trace_details.get("Traces", [])[0].get("Segments", []):
-                    document = json.loads(segment.get("Document"))
+            trace_ids = [trace.get("Id") for trace in response.get("TraceSummaries", [])]
+            for _, documents in fetcher.iter_documents(trace_ids):
+                for document in documents:
                     metadata = document.get("metadata", {})
                     if metadata_key in metadata:
                         found = True
@@ -194,14 +265,9 @@ def execute_and_validate_command(response, validation_checks):
             expected_message = check.get("expected")
             found = False
             
-            for trace in response.get("TraceSummaries", []):
-                trace_ids = [trace.get("Id")]
-                session = boto3.Session()
-                xray = session.client('xray')
-                trace_details = xray.batch_get_traces(TraceIds=trace_ids)
-                
-                for segment in trace_details.get("Traces", [])[0].get("Segments", []):
-                    document = json.loads(segment.get("Document"))
+            trace_ids = [trace.get("Id") for trace in response.get("TraceSummaries", [])]
+            for _, documents in fetcher.iter_documents(trace_ids):
+                for document in documents:
                     cause = document.get("cause", {})
                     exceptions = cause.get("exceptions", {})
                     for exception in exceptions:
@@ -246,7 +312,7 @@ def execute_and_validate_command(response, validation_checks):
             print(f"Expected: HTTP status code {expected_status_code}")
             print(f"Actual: {'✅ Found' if found else '❌ Not Found'}")
 
-def run_test_case(test_case):
+def run_test_case(test_case, fetcher):
     print(f"--- Execute Test Case: {test_case.get('test_case_id', 'N/A')} ---")
     print(f"Description: {test_case.get('description', 'N/A')}")
     
@@ -254,7 +320,7 @@ def run_test_case(test_case):
     
     validation_checks = test_case.get("validation_checks", [])
     if validation_checks:
-        execute_and_validate_command(response, validation_checks)
+        execute_and_validate_command(response, validation_checks, fetcher)
     
     print("--- Test End ---\n")
 
@@ -282,11 +348,14 @@ def main():
         sys.exit(1)
     
     print("\nStart executing tests...")
+    # segment documents are fetched once and shared by all checks and test cases
+    fetcher = TraceFetcher(session.client('xray'))
     for test_case in test_cases:
         if test_case.get('disabled', False):
             print(f"SKIPPING disabled test: {test_case.get('test_case_id', 'unknown')} - {test_case.get('description', 'no description')}")
             continue
-        run_test_case(test_case)
+        run_test_case(test_case, fetcher)
+    fetcher.close()
     
     print("All test cases executed")
 
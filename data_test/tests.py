@@ -0,0 +1,327 @@
+"""
+Unit tests for the Lambda test runner modules, run from data_test with:
+
+    python -m unittest tests
+
+Kept outside lambda/ so the deployment package does not ship them.
+"""
+import io
+import json
+import os
+import sys
+import threading
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda'))
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+import metrics_tester  # noqa: E402
+import run_metrics_tests  # noqa: E402
+from logs_scheduler import LogsQueryScheduler  # noqa: E402
+from result_publisher import EmfSink, ResultPublisher  # noqa: E402
+from traces_tester import TraceFetcher  # noqa: E402
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'operation')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeLogs:
+    """Logs Insights stand-in, each query completes after `polls` get_query_results calls"""
+
+    def __init__(self, polls=2, throttled_starts=0):
+        self.polls = polls
+        self.throttled_starts = throttled_starts
+        self.started = []
+        self.stopped = []
+        self.running = {}
+        self.max_running = 0
+
+    def start_query(self, **params):
+        if self.throttled_starts:
+            self.throttled_starts -= 1
+            raise client_error('LimitExceededException')
+        query_id = 'q%d' % len(self.started)
+        self.started.append(params)
+        self.running[query_id] = 0
+        self.max_running = max(self.max_running, len(self.running))
+        return {'queryId': query_id}
+
+    def get_query_results(self, queryId):
+        self.running[queryId] += 1
+        if self.running[queryId] < self.polls:
+            return {'status': 'Running'}
+        del self.running[queryId]
+        return {'status': 'Complete', 'results': [[{'field': 'id', 'value': queryId}]]}
+
+    def stop_query(self, queryId):
+        self.stopped.append(queryId)
+        self.running.pop(queryId, None)
+
+
+class LogsQuerySchedulerTests(unittest.TestCase):
+    def scheduler(self, client, **kwargs):
+        clock = FakeClock()
+        return LogsQueryScheduler(client, clock=clock, sleep=clock.sleep, **kwargs), clock
+
+    def run_queries(self, scheduler, count):
+        results = {}
+        for i in range(count):
+            scheduler.submit(lambda response, i=i: results.__setitem__(i, response), queryString='q%d' % i)
+        scheduler.run()
+        return results
+
+    def test_runs_every_query_within_the_concurrency_limit(self):
+        client = FakeLogs(polls=3)
+        scheduler, _ = self.scheduler(client, max_concurrent=2)
+        results = self.run_queries(scheduler, 5)
+        self.assertEqual(sorted(results), [0, 1, 2, 3, 4])
+        self.assertTrue(all(response['status'] == 'Complete' for response in results.values()))
+        self.assertEqual(client.max_running, 2)
+
+    def test_returns_as_soon_as_the_last_query_completes(self):
+        scheduler, clock = self.scheduler(FakeLogs(polls=2), timeout=240)
+        self.run_queries(scheduler, 1)
+        self.assertLess(clock.now, 5)
+
+    def test_throttled_starts_are_retried(self):
+        client = FakeLogs(throttled_starts=3)
+        scheduler, _ = self.scheduler(client)
+        results = self.run_queries(scheduler, 2)
+        self.assertEqual(len(client.started), 2)
+        self.assertTrue(all(results.values()))
+
+    def test_throttled_polls_are_retried(self):
+        client = FakeLogs()
+        results_calls = client.get_query_results
+        throttled = [client_error('ThrottlingException')]
+
+        def get_query_results(queryId):
+            if throttled:
+                raise throttled.pop()
+            return results_calls(queryId)
+
+        client.get_query_results = get_query_results
+        scheduler, _ = self.scheduler(client)
+        self.assertTrue(self.run_queries(scheduler, 1)[0])
+
+    def test_failed_start_and_failed_query_report_none(self):
+        client = FakeLogs()
+        start_query = client.start_query
+
+        def start_or_fail(**params):
+            if params['queryString'] == 'q0':
+                raise client_error('InvalidParameterException')
+            return start_query(**params)
+
+        client.start_query = start_or_fail
+        client.get_query_results = lambda queryId: {'status': 'Failed'}
+        scheduler, _ = self.scheduler(client)
+        with mock.patch('sys.stdout', io.StringIO()):
+            self.assertEqual(self.run_queries(scheduler, 2), {0: None, 1: None})
+
+    def test_deadline_stops_running_and_reports_pending_queries(self):
+        client = FakeLogs(polls=1_000)
+        scheduler, clock = self.scheduler(client, max_concurrent=1, timeout=10)
+        with mock.patch('sys.stdout', io.StringIO()):
+            results = self.run_queries(scheduler, 2)
+        self.assertEqual(results, {0: None, 1: None})
+        self.assertEqual(client.stopped, ['q0'])
+        self.assertEqual(len(client.started), 1)
+        self.assertLessEqual(clock.now, 10 + scheduler.max_delay)
+
+    def test_callback_errors_do_not_stop_the_run(self):
+        scheduler, _ = self.scheduler(FakeLogs())
+        done = []
+        scheduler.submit(lambda response: 1 / 0, queryString='q0')
+        scheduler.submit(done.append, queryString='q1')
+        with mock.patch('sys.stdout', io.StringIO()):
+            scheduler.run()
+        self.assertEqual(len(done), 1)
+
+
+class FakeCloudWatch:
+    """GetMetricData stand-in, rejects calls containing a query of a metric named "bad" """
+
+    def __init__(self, pages=1):
+        self.pages = pages
+        self.calls = []
+
+    def get_metric_data(self, StartTime, EndTime, MetricDataQueries, NextToken=None):
+        self.calls.append((StartTime, EndTime, MetricDataQueries, NextToken))
+        if any(query['MetricStat']['Metric']['MetricName'] == 'bad' for query in MetricDataQueries):
+            raise client_error('ValidationError')
+        page = int(NextToken or 0)
+        response = {'MetricDataResults': [{'Id': query['Id'], 'Values': [page]} for query in MetricDataQueries]}
+        if page + 1 < self.pages:
+            response['NextToken'] = str(page + 1)
+        return response
+
+
+def metric_case(name='m', minutes=5, period=60):
+    return {'metric_namespace': 'ns', 'metric_name': name, 'statistic': 'Sum',
+            'evaluation_period_minutes': minutes, 'period': period}
+
+
+class FetchMetricDataTests(unittest.TestCase):
+    def fetch(self, test_cases, client):
+        with mock.patch.object(metrics_tester, 'cloudwatch', client), mock.patch('sys.stdout', io.StringIO()):
+            return metrics_tester.fetch_metric_data(test_cases)
+
+    def test_cases_share_calls_by_window_and_period(self):
+        client = FakeCloudWatch()
+        responses = self.fetch([metric_case(), metric_case(), metric_case(minutes=10), metric_case(period=300)], client)
+        calls = [(end - start, queries[0]['MetricStat']['Period'], len(queries)) for start, end, queries, _ in client.calls]
+        self.assertEqual(
+            sorted(calls),
+            sorted([(timedelta(minutes=5), 60, 2), (timedelta(minutes=10), 60, 1), (timedelta(minutes=5), 300, 1)]),
+        )
+        self.assertTrue(all(responses))
+
+    def test_calls_are_split_at_the_query_limit(self):
+        client = FakeCloudWatch()
+        responses = self.fetch([metric_case() for _ in range(1001)], client)
+        self.assertEqual([len(queries) for _, _, queries, _ in client.calls], [500, 500, 1])
+        self.assertEqual(len(responses), 1001)
+
+    def test_next_token_pages_are_merged_per_case(self):
+        client = FakeCloudWatch(pages=3)
+        [first, second] = self.fetch([metric_case(), metric_case()], client)
+        self.assertEqual(first['MetricDataResults'][0]['Values'], [0, 1, 2])
+        self.assertEqual(second['MetricDataResults'][0]['Values'], [0, 1, 2])
+        self.assertEqual([token for _, _, _, token in client.calls], [None, '1', '2'])
+
+    def test_a_failing_query_only_fails_its_own_case(self):
+        client = FakeCloudWatch()
+        test_cases = [metric_case('bad' if i == 3 else 'm') for i in range(10)]
+        responses = self.fetch(test_cases, client)
+        self.assertEqual([response is None for response in responses], [i == 3 for i in range(10)])
+        # bisected, not retried one by one
+        self.assertLess(len(client.calls), 10)
+
+    def test_script_isolates_a_failing_query(self):
+        client = FakeCloudWatch()
+        test_cases = [metric_case('bad' if i == 1 else 'm') for i in range(4)]
+        with mock.patch.object(run_metrics_tests.boto3, 'Session') as session, mock.patch('sys.stdout', io.StringIO()):
+            session.return_value.client.return_value = client
+            responses = run_metrics_tests.fetch_metric_data(test_cases)
+        self.assertEqual([response is None for response in responses], [False, True, False, False])
+
+
+class ResultPublisherTests(unittest.TestCase):
+    def test_a_case_recorded_twice_is_published_once_with_its_last_result(self):
+        sink = mock.Mock()
+        publisher = ResultPublisher(sink)
+        case = {'test_case_id': 'c1', 'test_scenario': 's1'}
+        publisher.record(case, 'metrics', False)
+        publisher.record({'test_case_id': 'c2', 'test_scenario': 's1'}, 'metrics', True)
+        publisher.record(case, 'metrics', True)
+        publisher.record(case, 'logs', False)
+        self.assertEqual(publisher.flush(), 3)
+        [results] = sink.publish.call_args.args
+        self.assertEqual(
+            [(r['test_type'], r['test_case_id'], r['passed']) for r in results],
+            [('metrics', 'c2', True), ('metrics', 'c1', True), ('logs', 'c1', False)],
+        )
+
+    def test_flush_empties_the_buffer(self):
+        sink = mock.Mock()
+        publisher = ResultPublisher(sink)
+        publisher.record({'test_case_id': 'c1'}, 'traces', True)
+        publisher.flush()
+        self.assertEqual(publisher.flush(), 0)
+        sink.publish.assert_called_once()
+
+    def test_emf_lines_carry_the_result_as_a_metric(self):
+        stream = io.StringIO()
+        publisher = ResultPublisher(EmfSink(stream))
+        publisher.record({'test_case_id': 'c1', 'test_scenario': 's1'}, 'metrics', True)
+        publisher.flush()
+        [document] = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(document['TestResult'], 1)
+        self.assertEqual(document['_aws']['CloudWatchMetrics'][0]['Dimensions'], [['TestType', 'TestCaseId', 'TestScenario']])
+        self.assertEqual((document['TestType'], document['TestCaseId'], document['TestScenario']), ('metrics', 'c1', 's1'))
+
+
+class FakeXRay:
+    def __init__(self, fail=0, pages=1):
+        self.fail = fail
+        self.pages = pages
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def batch_get_traces(self, TraceIds, NextToken=None):
+        with self.lock:
+            self.calls.append(list(TraceIds))
+            if self.fail:
+                self.fail -= 1
+                raise client_error('ThrottlingException')
+        page = int(NextToken or 0)
+        response = {'Traces': [
+            {'Id': trace_id, 'Segments': [{'Document': json.dumps({'id': '%s-%d' % (trace_id, page)})}]}
+            for trace_id in TraceIds
+        ]}
+        if page + 1 < self.pages:
+            response['NextToken'] = str(page + 1)
+        return response
+
+
+class TraceFetcherTests(unittest.TestCase):
+    def fetcher(self, client, max_workers=2):
+        fetcher = TraceFetcher(client, max_workers=max_workers)
+        self.addCleanup(fetcher.close)
+        return fetcher
+
+    def test_fetches_in_batches_and_follows_pages(self):
+        client = FakeXRay(pages=2)
+        fetcher = self.fetcher(client)
+        trace_ids = ['t%d' % i for i in range(7)]
+        documents = dict(fetcher.iter_documents(trace_ids))
+        self.assertEqual(list(documents), trace_ids)
+        self.assertEqual(documents['t0'], [{'id': 't0-0'}, {'id': 't0-1'}])
+        self.assertEqual(sorted(len(call) for call in client.calls), [2, 2, 5, 5])
+
+    def test_cached_traces_are_not_fetched_again(self):
+        client = FakeXRay()
+        fetcher = self.fetcher(client)
+        fetcher.documents(['t1', 't2'])
+        fetcher.documents(['t2', 't3'])
+        self.assertEqual(client.calls, [['t1', 't2'], ['t3']])
+
+    def test_failed_fetch_raises_and_is_retried_by_the_next_call(self):
+        client = FakeXRay(fail=1)
+        fetcher = self.fetcher(client)
+        with self.assertRaises(ClientError):
+            fetcher.documents(['t1'])
+        self.assertEqual(fetcher.documents(['t1']), {'t1': [{'id': 't1-0'}]})
+
+    def test_a_failed_batch_does_not_poison_other_batches(self):
+        client = FakeXRay(fail=1)
+        fetcher = self.fetcher(client, max_workers=1)
+        trace_ids = ['t%d' % i for i in range(10)]
+        with self.assertRaises(ClientError):
+            fetcher.documents(trace_ids)
+        # the second batch of five was fetched and cached, only the failed one is fetched again
+        fetcher.documents(trace_ids)
+        self.assertEqual(client.calls[-1], trace_ids[:5])
+        self.assertEqual(len(client.calls), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class BillingServiceConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "billing_service"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from pet_clinic_billing_service.bootstrap import bootstrap
+        bootstrap.start()
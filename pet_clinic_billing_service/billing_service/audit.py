@@ -0,0 +1,161 @@
+from opentelemetry import metrics
+import atexit
+import boto3
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+MAX_BATCH_SIZE = 25  # BatchWriteItem limit
+
+
+class AuditWriter:
+    """
+    Process-wide background writer of billing audit records to DynamoDB.
+
+    Request threads only enqueue. A single daemon thread drains the bounded queue,
+    coalesces records into BatchWriteItem calls of up to 25 items and retries
+    unprocessed items with exponential backoff. Records are dropped (and counted)
+    when the queue is full rather than blocking the request.
+    """
+
+    def __init__(self, table_name, region, max_queue_size=10_000, flush_interval=0.5,
+                 max_retries=5, base_backoff=0.05):
+        self.table_name = table_name
+        self.region = region
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self._client = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+        self.dropped = meter.create_counter(
+            "billing.audit.dropped", unit="1", description="Audit records dropped because the queue was full or retries ran out")
+        self.written = meter.create_counter(
+            "billing.audit.written", unit="1", description="Audit records written to DynamoDB")
+        self.latency = meter.create_histogram(
+            "billing.audit.latency", unit="ms", description="Time from enqueue until the record was written")
+        self.batch_latency = meter.create_histogram(
+            "billing.audit.batch_write_latency", unit="ms", description="Duration of a BatchWriteItem call, retries included")
+        meter.create_observable_gauge(
+            "billing.audit.queue_depth", callbacks=[self._observe_queue_depth], unit="1",
+            description="Audit records waiting to be written")
+
+    def enqueue(self, item):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((time.monotonic(), item))
+            return True
+        except queue.Full:
+            logger.warning("AuditWriter queue is full - dropping audit record")
+            self.dropped.add(1)
+            return False
+
+    def flush(self, timeout=5):
+        """Stop the writer thread after it has drained the queue."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("AuditWriter could not signal shutdown, queue is full")
+            return
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        # (re)start lazily so a pre-forked worker gets its own thread and client
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # forked: the records left in the queue belong to the parent
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._pid = os.getpid()
+            self._client = boto3.client('dynamodb', region_name=self.region)
+            self._thread = threading.Thread(target=self._run, name="billing-audit-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                entry = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while entry is not None:
+                batch.append(entry)
+                if len(batch) == MAX_BATCH_SIZE:
+                    break
+                try:
+                    entry = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            stopping = entry is None
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        # items sharing a key in one request are rejected by DynamoDB, the last one wins
+        # as it would have with consecutive put_item calls
+        by_key = {}
+        for enqueued_at, item in batch:
+            by_key[(item['ownerId']['S'], item['timestamp']['S'])] = (enqueued_at, item)
+        entries = list(by_key.values())
+
+        start = time.monotonic()
+        requests = [{'PutRequest': {'Item': item}} for _, item in entries]
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._client.batch_write_item(RequestItems={self.table_name: requests})
+                requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            except Exception as e:
+                logger.error("AuditWriter batch_write_item failed: %s", e)
+            if not requests:
+                break
+            if attempt < self.max_retries:
+                time.sleep(self.base_backoff * (2 ** attempt) * (1 + random.random()))
+
+        now = time.monotonic()
+        self.batch_latency.record((now - start) * 1_000)
+        written = len(entries) - len(requests)
+        self.written.add(written)
+        if requests:
+            logger.error("AuditWriter gave up on %s audit records after %s retries", len(requests), self.max_retries)
+            self.dropped.add(len(requests))
+        for enqueued_at, _ in entries:
+            self.latency.record((now - enqueued_at) * 1_000)
+
+    def _observe_queue_depth(self, options):
+        yield metrics.Observation(self.queue.qsize())
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditWriter(
+                    table_name='BillingInfo',
+                    region=os.environ.get('REGION', 'us-east-1'),
+                    max_queue_size=int(os.getenv("AUDIT_QUEUE_SIZE", 10_000)),
+                    flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", 0.5)),
+                )
+                atexit.register(_writer.flush)
+    return _writer
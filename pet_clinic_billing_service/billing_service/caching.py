@@ -0,0 +1,86 @@
+from django.core.cache import cache
+from django.db import connections
+import logging
+import math
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+HIT = 'hit'
+MISS = 'miss'
+STALE = 'stale'
+
+
+def get_or_refresh(key, compute, ttl, stale_ttl=None, beta=1.0, lock_timeout=30, wait_timeout=5):
+    """
+    Stale-while-revalidate read through the default cache.
+
+    Entries are kept for `ttl + stale_ttl` seconds. Past `ttl` (or earlier, via
+    probabilistic early expiration) the stored value is still served while a single
+    background thread recomputes it. Only the worker holding the per-key lock recomputes,
+    on a cold miss the others wait for its result instead of piling onto `compute`.
+
+    Returns (value, status) where status is one of HIT, MISS or STALE.
+    """
+    stale_ttl = ttl if stale_ttl is None else stale_ttl
+    entry = cache.get(key)
+
+    if entry is not None:
+        if not _should_refresh(entry, beta):
+            return entry['value'], HIT
+        if _acquire(key, lock_timeout):
+            threading.Thread(
+                target=_refresh_in_background, args=(key, compute, ttl, stale_ttl), daemon=True
+            ).start()
+        return entry['value'], STALE
+
+    if _acquire(key, lock_timeout):
+        try:
+            return _refresh(key, compute, ttl, stale_ttl), MISS
+        finally:
+            _release(key)
+
+    # another worker is computing this key, wait for its result
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value'], MISS
+    logger.warning("Timed out waiting for cache refresh of %s, computing locally", key)
+    return compute(), MISS
+
+
+def _should_refresh(entry, beta):
+    # XFetch: refresh early with a probability that grows as expiry approaches,
+    # weighted by how long the value took to compute
+    now = time.time()
+    return now - entry['delta'] * beta * math.log(1 - random.random()) >= entry['expires_at']
+
+
+def _refresh(key, compute, ttl, stale_ttl):
+    start = time.time()
+    value = compute()
+    delta = time.time() - start
+    cache.set(key, {'value': value, 'delta': delta, 'expires_at': time.time() + ttl}, ttl + stale_ttl)
+    return value
+
+
+def _refresh_in_background(key, compute, ttl, stale_ttl):
+    try:
+        _refresh(key, compute, ttl, stale_ttl)
+    except Exception as e:
+        logger.error("Background cache refresh of %s failed: %s", key, e)
+    finally:
+        _release(key)
+        connections.close_all()
+
+
+def _acquire(key, lock_timeout):
+    return cache.add(f'{key}:lock', 1, lock_timeout)
+
+
+def _release(key):
+    cache.delete(f'{key}:lock')
@@ -0,0 +1,46 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from billing_service.models import Billing, BillingAggregate
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the billing_aggregate summary table from the billings, scanning in batches. "
+        "Billing writes wait until the rebuild is done."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        totals = defaultdict(lambda: [0, Decimal(0)])
+        billings = 0
+        last_id = 0
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # writes landing between the scan and the swap would be lost or counted twice
+                with connection.cursor() as cursor:
+                    cursor.execute('LOCK TABLE %s IN SHARE MODE' % connection.ops.quote_name(Billing._meta.db_table))
+            while True:
+                batch = list(
+                    Billing.objects.filter(id__gt=last_id).order_by('id')
+                    .values_list('id', 'status', 'type', 'payment')[:batch_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                billings += len(batch)
+                for _, status, type, payment in batch:
+                    for key in ((BillingAggregate.STATUS, status), (BillingAggregate.TYPE, type)):
+                        totals[key][0] += 1
+                        totals[key][1] += payment
+
+            BillingAggregate.objects.all().delete()
+            BillingAggregate.objects.bulk_create([
+                BillingAggregate(dimension=dimension, key=key, count=count, amount=amount)
+                for (dimension, key), (count, amount) in totals.items()
+            ])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt billing summary - {billings} billings"))
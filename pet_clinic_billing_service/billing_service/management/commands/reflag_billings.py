@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from billing_service.models import Billing
+from billing_service.signals import reflag_type_names
+
+
+class Command(BaseCommand):
+    help = "Recompute Billing.invalid_type_name against the CheckList table in batches of type names"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1_000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_name = None
+        total = 0
+        while True:
+            names = Billing.objects.order_by('type_name').values_list('type_name', flat=True).distinct()
+            if last_name is not None:
+                names = names.filter(type_name__gt=last_name)
+            batch = list(names[:batch_size])
+            if not batch:
+                break
+            last_name = batch[-1]
+            reflag_type_names(batch)
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Re-flagged billings for {total} type names"))
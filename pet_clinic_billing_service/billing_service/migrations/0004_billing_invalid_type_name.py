@@ -0,0 +1,46 @@
+# Generated by Django 4.2.16 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+def flag_invalid_type_names(apps, schema_editor):
+    Billing = apps.get_model('billing_service', 'Billing')
+    CheckList = apps.get_model('billing_service', 'CheckList')
+
+    batch_size = 1_000
+    last_name = None
+    while True:
+        names = Billing.objects.order_by('type_name').values_list('type_name', flat=True).distinct()
+        if last_name is not None:
+            names = names.filter(type_name__gt=last_name)
+        batch = list(names[:batch_size])
+        if not batch:
+            break
+        last_name = batch[-1]
+        invalid = CheckList.objects.filter(invalid_name__in=batch).values_list('invalid_name', flat=True)
+        Billing.objects.filter(type_name__in=list(invalid)).update(invalid_type_name=True)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_service', '0003_fill_checklist'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='checklist',
+            name='invalid_name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='billing',
+            name='type_name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='billing',
+            name='invalid_type_name',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(flag_invalid_type_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.16 on 2026-10-17 10:03
+
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def fill_billing_aggregate(apps, schema_editor):
+    Billing = apps.get_model('billing_service', 'Billing')
+    BillingAggregate = apps.get_model('billing_service', 'BillingAggregate')
+
+    batch_size = 10_000
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    last_id = 0
+    while True:
+        batch = list(
+            Billing.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'status', 'type', 'payment')[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        for _, status, type, payment in batch:
+            for key in (('status', status), ('type', type)):
+                totals[key][0] += 1
+                totals[key][1] += payment
+
+    BillingAggregate.objects.bulk_create([
+        BillingAggregate(dimension=dimension, key=key, count=count, amount=amount)
+        for (dimension, key), (count, amount) in totals.items()
+    ])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_service', '0004_billing_invalid_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=200)),
+                ('count', models.BigIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'db_table': 'billing_aggregate',
+                'unique_together': {('dimension', 'key')},
+            },
+        ),
+        migrations.RunPython(fill_billing_aggregate, migrations.RunPython.noop),
+    ]
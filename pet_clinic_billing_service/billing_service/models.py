@@ -1,22 +1,52 @@
-from django.db import models
+from django.db import models, transaction
 
 # Create your models here.
 class Billing(models.Model):
     owner_id   = models.IntegerField()
     type = models.CharField(max_length=200)
-    type_name = models.CharField(max_length=200)
+    type_name = models.CharField(max_length=200, db_index=True)
     pet_id = models.IntegerField()
     payment = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20)
+    # denormalised from CheckList at write time, see signals.py
+    invalid_type_name = models.BooleanField(default=False, db_index=True)
 
     class Meta:
         unique_together = ('owner_id', 'pet_id', 'type')
 
+    def save(self, *args, **kwargs):
+        self.invalid_type_name = CheckList.objects.filter(invalid_name=self.type_name).exists()
+        # the summary aggregates are maintained by signals inside this transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return self.owner_id
 
 class CheckList(models.Model):
-    invalid_name = models.CharField(max_length=200)
+    invalid_name = models.CharField(max_length=200, db_index=True)
 
     class Meta:
         db_table = 'check_list'
+
+
+class BillingAggregate(models.Model):
+    """
+    Running count and payment sum of billings per status / type. There is no overall
+    row for every write to contend on, the totals are the sum of the status rows.
+    """
+    STATUS = 'status'
+    TYPE = 'type'
+
+    dimension = models.CharField(max_length=20)
+    key = models.CharField(max_length=200)
+    count = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'billing_aggregate'
+        unique_together = ('dimension', 'key')
@@ -0,0 +1,16 @@
+from rest_framework.pagination import CursorPagination
+import os
+
+
+class BillingCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the billing primary key.
+
+    Every page is a bounded `id > cursor ORDER BY id LIMIT page_size` range scan
+    on the primary key index, so the cost of a page does not grow with the table.
+    The cursor is the opaque, base64 encoded position issued by DRF.
+    """
+    ordering = 'id'
+    page_size = int(os.getenv("BILLING_PAGE_SIZE", 100))
+    page_size_query_param = 'page_size'
+    max_page_size = int(os.getenv("BILLING_MAX_PAGE_SIZE", 1_000))
@@ -4,7 +4,12 @@ from .models import Billing
 class BillingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Billing
-        fields = '__all__'
+        exclude = ['invalid_type_name']
+
+class BillingUpsertSerializer(BillingSerializer):
+    class Meta(BillingSerializer.Meta):
+        # an upsert resolves (owner_id, pet_id, type) conflicts instead of rejecting them
+        validators = []
 
 class HealthSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,114 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Billing, BillingAggregate, CheckList
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def reflag_type_names(type_names):
+    """
+    Recompute Billing.invalid_type_name for the billings using any of the given type names.
+    """
+    type_names = set(type_names)
+    if not type_names:
+        return
+    invalid = set(
+        CheckList.objects.filter(invalid_name__in=type_names).values_list('invalid_name', flat=True)
+    )
+    flagged = Billing.objects.filter(type_name__in=invalid, invalid_type_name=False).update(invalid_type_name=True)
+    cleared = Billing.objects.filter(type_name__in=type_names - invalid, invalid_type_name=True).update(invalid_type_name=False)
+    logger.info("Re-flagged billings for %s type names - flagged: %s, cleared: %s", len(type_names), flagged, cleared)
+
+
+def schedule_reflag(*type_names):
+    transaction.on_commit(lambda: reflag_type_names(type_names))
+
+
+@receiver(pre_save, sender=CheckList)
+def remember_previous_name(sender, instance, **kwargs):
+    instance._previous_invalid_name = None
+    if instance.pk is not None:
+        instance._previous_invalid_name = (
+            CheckList.objects.filter(pk=instance.pk).values_list('invalid_name', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=CheckList)
+def checklist_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_invalid_name', None)
+    if previous is not None and previous != instance.invalid_name:
+        schedule_reflag(instance.invalid_name, previous)
+    else:
+        schedule_reflag(instance.invalid_name)
+
+
+@receiver(post_delete, sender=CheckList)
+def checklist_deleted(sender, instance, **kwargs):
+    schedule_reflag(instance.invalid_name)
+
+
+def apply_billing_delta(status, type, sign, payment):
+    """
+    Add (sign=1) or remove (sign=-1) one billing from the summary aggregates.
+    """
+    apply_billing_deltas([(status, type, sign, payment)])
+
+
+def apply_billing_deltas(deltas):
+    """
+    Apply many (status, type, sign, payment) deltas with a single
+    INSERT ... ON CONFLICT DO UPDATE over the aggregate rows they change.
+    """
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    for status, type, sign, payment in deltas:
+        amount = sign * Decimal(str(payment))
+        for key in ((BillingAggregate.STATUS, status), (BillingAggregate.TYPE, type)):
+            totals[key][0] += sign
+            totals[key][1] += amount
+    # rows in a fixed order so concurrent writers lock them in the same order
+    rows = sorted((key, total) for key, total in totals.items() if total[0] or total[1])
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    amount_field = BillingAggregate._meta.get_field('amount')
+    table, count, amount = quote(BillingAggregate._meta.db_table), quote('count'), quote('amount')
+    params = []
+    for (dimension, key), (delta_count, delta_amount) in rows:
+        params += [dimension, key, delta_count, amount_field.get_db_prep_save(delta_amount, connection)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO %s (%s, %s, %s, %s) VALUES %s ON CONFLICT (%s, %s) DO UPDATE '
+            'SET %s = %s.%s + EXCLUDED.%s, %s = %s.%s + EXCLUDED.%s' % (
+                table, quote('dimension'), quote('key'), count, amount,
+                ', '.join(['(%s, %s, %s, %s)'] * len(rows)), quote('dimension'), quote('key'),
+                count, table, count, count, amount, table, amount, amount,
+            ),
+            params,
+        )
+
+
+@receiver(pre_save, sender=Billing)
+def remember_previous_billing(sender, instance, **kwargs):
+    instance._previous_billing = None
+    if instance.pk is not None:
+        instance._previous_billing = (
+            Billing.objects.filter(pk=instance.pk).values('status', 'type', 'payment').first()
+        )
+
+
+@receiver(post_save, sender=Billing)
+def billing_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_billing', None)
+    deltas = [(instance.status, instance.type, 1, instance.payment)]
+    if previous is not None:
+        deltas.append((previous['status'], previous['type'], -1, previous['payment']))
+    apply_billing_deltas(deltas)
+
+
+@receiver(post_delete, sender=Billing)
+def billing_deleted(sender, instance, **kwargs):
+    apply_billing_delta(instance.status, instance.type, -1, instance.payment)
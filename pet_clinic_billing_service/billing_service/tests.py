@@ -1,3 +1,474 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
+import io
+import json
+import logging
+import os
+import sys
+import time
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from pet_clinic_billing_service.bootstrap import bootstrap
+from pet_clinic_common import logging_pipeline
+from pet_clinic_common.cache_backends import TwoTierCache
+from . import audit, caching, upsert
+from .models import Billing, BillingAggregate, CheckList
+from .upsert import UPDATE_FIELDS, rows_by_key, upsert_billings
+from .views import SummaryViewSet
+
+
+def billing_record(owner_id=1, pet_id=1, type='insurance', type_name='basic', payment='10.00', status='open'):
+    return {
+        'owner_id': owner_id,
+        'pet_id': pet_id,
+        'type': type,
+        'type_name': type_name,
+        'payment': Decimal(payment),
+        'status': status,
+    }
+
+
+def aggregate(dimension, key):
+    row = BillingAggregate.objects.filter(dimension=dimension, key=key).values('count', 'amount').first()
+    return (row['count'], row['amount']) if row else (0, Decimal(0))
+
+
+def totals():
+    summary = SummaryViewSet().read_summary()
+    return (summary['total_count'], summary['total_amount'])
+
+
+class UpsertBillingsTests(TestCase):
+    def test_reports_created_and_updated_rows(self):
+        [(first, created)] = upsert_billings([billing_record(pet_id=1)])
+        self.assertTrue(created)
+        upserted = upsert_billings([billing_record(pet_id=1, payment='12.00'), billing_record(pet_id=2)])
+        self.assertEqual([created for _, created in upserted], [False, True])
+        self.assertEqual(upserted[0][0].pk, first.pk)
+        self.assertEqual(Billing.objects.get(pk=first.pk).payment, Decimal('12.00'))
+        self.assertEqual(Billing.objects.count(), 2)
+
+    def test_existing_rows_keep_fields_left_out_of_update_fields(self):
+        upsert_billings([billing_record(status='paid')])
+        keep_status = [field for field in UPDATE_FIELDS if field != 'status']
+        [(billing, created)] = upsert_billings([billing_record(payment='15.00', status='open')], update_fields=keep_status)
+        self.assertFalse(created)
+        self.assertEqual(billing.status, 'paid')
+        self.assertEqual(Billing.objects.get().status, 'paid')
+
+    def test_flags_invalid_type_names(self):
+        # the check list is seeded by a data migration
+        invalid_name = CheckList.objects.values_list('invalid_name', flat=True).first()
+        [(billing, _)] = upsert_billings([billing_record(type_name=invalid_name)])
+        self.assertTrue(Billing.objects.get(pk=billing.pk).invalid_type_name)
+
+    def test_maintains_the_summary_aggregates(self):
+        upsert_billings([billing_record(pet_id=1, payment='10.00'), billing_record(pet_id=2, payment='5.00')])
+        upsert_billings([billing_record(pet_id=1, payment='20.00', status='paid')])
+        self.assertEqual(totals(), (2, Decimal('25.00')))
+        self.assertEqual(aggregate(BillingAggregate.STATUS, 'open'), (1, Decimal('5.00')))
+        self.assertEqual(aggregate(BillingAggregate.STATUS, 'paid'), (1, Decimal('20.00')))
+        self.assertEqual(aggregate(BillingAggregate.TYPE, 'insurance'), (2, Decimal('25.00')))
+
+    def test_row_inserted_concurrently_is_updated_and_counted_once(self):
+        # another transaction inserts the billing after the lookup found nothing
+        lookup = rows_by_key
+
+        def racing_lookup(keys, lock=False):
+            if racing_lookup.first:
+                racing_lookup.first = False
+                Billing.objects.create(**billing_record(payment='7.00'))
+                return {}
+            return lookup(keys, lock)
+        racing_lookup.first = True
+
+        with mock.patch.object(upsert, 'rows_by_key', side_effect=racing_lookup):
+            [(billing, created)] = upsert_billings([billing_record(payment='9.00')])
+        self.assertFalse(created)
+        self.assertEqual(Billing.objects.get().payment, Decimal('9.00'))
+        self.assertEqual(totals(), (1, Decimal('9.00')))
+
+    def test_rows_by_key_matches_exact_keys_only(self):
+        upsert_billings([billing_record(owner_id=1, pet_id=2), billing_record(owner_id=2, pet_id=1)])
+        rows = rows_by_key([(1, 1, 'insurance'), (2, 1, 'insurance')], lock=True)
+        self.assertEqual(list(rows), [(2, 1, 'insurance')])
+
+
+def audit_item(owner_id, timestamp='2024-05-01 10:00:00', billing='{}'):
+    return {'ownerId': {'S': str(owner_id)}, 'timestamp': {'S': timestamp}, 'billing': {'S': billing}}
+
+
+class AuditWriterTests(SimpleTestCase):
+    def writer(self, client=None, **kwargs):
+        client = client or mock.Mock(**{'batch_write_item.return_value': {}})
+        writer = audit.AuditWriter('BillingInfo', 'us-east-1', **kwargs)
+        writer.dropped, writer.written = mock.Mock(), mock.Mock()
+        patcher = mock.patch.object(audit.boto3, 'client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(writer.flush)
+        return writer, client
+
+    def written_batches(self, client):
+        return [call.kwargs['RequestItems']['BillingInfo'] for call in client.batch_write_item.call_args_list]
+
+    def test_flush_writes_everything_queued_in_batches_of_25(self):
+        writer, client = self.writer(flush_interval=5)
+        for owner_id in range(60):
+            writer.enqueue(audit_item(owner_id))
+        writer.flush()
+        self.assertEqual([len(batch) for batch in self.written_batches(client)], [25, 25, 10])
+        self.assertFalse(writer._thread.is_alive())
+
+    def test_unprocessed_items_are_retried_with_backoff(self):
+        unprocessed = {'UnprocessedItems': {'BillingInfo': [{'PutRequest': {'Item': audit_item(2)}}]}}
+        writer, client = self.writer()
+        client.batch_write_item.side_effect = [unprocessed, unprocessed, {}]
+        writer._client = client
+        with mock.patch.object(audit.time, 'sleep') as sleep, mock.patch.object(audit.random, 'random', return_value=0):
+            writer._write([(0, audit_item(1)), (0, audit_item(2))])
+        self.assertEqual([len(batch) for batch in self.written_batches(client)], [2, 1, 1])
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.05, 0.1])
+        writer.written.add.assert_called_once_with(2)
+        writer.dropped.add.assert_not_called()
+
+    def test_items_still_unprocessed_after_the_retries_are_dropped(self):
+        unprocessed = {'UnprocessedItems': {'BillingInfo': [{'PutRequest': {'Item': audit_item(1)}}]}}
+        writer, client = self.writer(max_retries=2)
+        client.batch_write_item.return_value = unprocessed
+        writer._client = client
+        with mock.patch.object(audit.time, 'sleep'), self.assertLogs('billing_service.audit', 'ERROR'):
+            writer._write([(0, audit_item(1)), (0, audit_item(2))])
+        self.assertEqual(client.batch_write_item.call_count, 3)
+        writer.written.add.assert_called_once_with(1)
+        writer.dropped.add.assert_called_once_with(1)
+
+    def test_records_are_dropped_and_counted_when_the_queue_is_full(self):
+        writer, _ = self.writer(max_queue_size=1)
+        with mock.patch.object(writer, '_ensure_started'), self.assertLogs('billing_service.audit', 'WARNING'):
+            self.assertTrue(writer.enqueue(audit_item(1)))
+            self.assertFalse(writer.enqueue(audit_item(2)))
+        writer.dropped.add.assert_called_once_with(1)
+
+    def test_records_of_the_same_owner_and_second_are_written_once(self):
+        writer, client = self.writer()
+        writer._client = client
+        writer._write([(0, audit_item(1, billing='first')), (0, audit_item(2)), (0, audit_item(1, billing='last'))])
+        [batch] = self.written_batches(client)
+        self.assertEqual([request['PutRequest']['Item']['billing']['S'] for request in batch], ['last', '{}'])
+
+    def test_the_shared_writer_is_flushed_at_exit(self):
+        with mock.patch.object(audit, '_writer', None), mock.patch.object(audit.atexit, 'register') as register:
+            writer = audit.get_audit_writer()
+            self.assertIs(audit.get_audit_writer(), writer)
+        register.assert_called_once_with(writer.flush)
+
+
+@mock.patch('billing_service.views.get_audit_writer')
+class BillingUpsertViewTests(TestCase):
+    url = '/billings/1/2/insurance/'
+
+    def put(self, body):
+        return self.client.put(self.url, body, content_type='application/json')
+
+    def test_creates_then_updates_the_billing(self, audit_writer):
+        response = self.put({'type_name': 'basic', 'payment': '10.00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'open')
+        response = self.put({'type_name': 'basic', 'payment': '12.00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Billing.objects.get().payment, Decimal('12.00'))
+
+    def test_an_existing_billing_keeps_its_status_when_none_is_sent(self, audit_writer):
+        self.put({'type_name': 'basic', 'payment': '10.00', 'status': 'paid'})
+        response = self.put({'type_name': 'basic', 'payment': '12.00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'paid')
+
+    def test_rejects_a_body_that_is_not_an_object(self, audit_writer):
+        for body in ([{'type_name': 'basic', 'payment': '10.00'}], 'basic', 3):
+            self.assertEqual(self.put(body).status_code, 400)
+        self.assertFalse(Billing.objects.exists())
+
+    def test_rejects_an_invalid_billing(self, audit_writer):
+        self.assertEqual(self.put({'type_name': 'basic', 'payment': 'ten'}).status_code, 400)
+
+
+class BillingPaginationTests(TestCase):
+    def test_cursor_pages_cover_every_valid_billing_once(self):
+        upsert_billings([billing_record(pet_id=pet_id) for pet_id in range(1, 6)])
+        invalid_name = CheckList.objects.values_list('invalid_name', flat=True).first()
+        upsert_billings([billing_record(pet_id=6, type_name=invalid_name)])
+
+        seen, url = [], '/billings/?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            seen += [billing['pet_id'] for billing in page['results']]
+            url = page['next']
+        self.assertEqual(seen, [1, 2, 3, 4, 5])
+
+    def test_page_size_is_capped(self):
+        with mock.patch('billing_service.pagination.BillingCursorPagination.max_page_size', 3):
+            upsert_billings([billing_record(pet_id=pet_id) for pet_id in range(1, 6)])
+            page = self.client.get('/billings/?page_size=50').json()
+        self.assertEqual(len(page['results']), 3)
+
+
+class BillingStreamTests(TestCase):
+    def setUp(self):
+        upsert_billings([billing_record(pet_id=pet_id) for pet_id in range(1, 4)])
+
+    def test_streams_a_json_array_under_wsgi(self):
+        response = self.client.get('/billings/?stream=true')
+        self.assertFalse(response.is_async)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(sorted(row['pet_id'] for row in rows), [1, 2, 3])
+
+    async def test_streams_chunks_asynchronously_under_asgi(self):
+        response = await self.async_client.get('/billings/?stream=true')
+        self.assertTrue(response.is_async)
+        rows = json.loads(b''.join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual(sorted(row['pet_id'] for row in rows), [1, 2, 3])
+
+    def test_failure_midway_closes_the_array_with_an_error_marker(self):
+        original = QuerySet.iterator
+
+        def failing_iterator(qs, chunk_size=None):
+            rows = original(qs, chunk_size=chunk_size)
+            yield next(rows)
+            raise DatabaseError("connection lost")
+
+        with mock.patch.dict(os.environ, {'BILLING_STREAM_CHUNK_SIZE': '1'}), \
+                mock.patch.object(QuerySet, 'iterator', failing_iterator), \
+                self.assertLogs('billing_service.views', 'ERROR'):
+            response = self.client.get('/billings/?stream=true')
+            rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[-1]['records_sent'], 1)
+        self.assertIn('error', rows[-1])
+
+
+class BillingAggregateTests(TestCase):
+    def test_saving_and_deleting_a_billing_keeps_the_aggregates_current(self):
+        billing = Billing.objects.create(**billing_record(payment='10.00'))
+        billing.status = 'paid'
+        billing.payment = Decimal('12.00')
+        billing.save()
+        self.assertEqual(aggregate(BillingAggregate.STATUS, 'open'), (0, Decimal('0')))
+        self.assertEqual(aggregate(BillingAggregate.STATUS, 'paid'), (1, Decimal('12.00')))
+        self.assertEqual(totals(), (1, Decimal('12.00')))
+        billing.delete()
+        self.assertEqual(totals(), (0, Decimal('0')))
+        self.assertEqual(aggregate(BillingAggregate.TYPE, 'insurance'), (0, Decimal('0')))
+
+    def test_summary_leaves_out_empty_rows(self):
+        Billing.objects.create(**billing_record(payment='10.00')).delete()
+        Billing.objects.create(**billing_record(pet_id=2, payment='3.00', status='paid'))
+        summary = SummaryViewSet().read_summary()
+        self.assertEqual(summary['by_status'], {'paid': {'count': 1, 'amount': Decimal('3.00')}})
+        self.assertEqual(summary['by_type'], {'insurance': {'count': 1, 'amount': Decimal('3.00')}})
+
+    def test_rebuild_matches_the_incremental_aggregates(self):
+        upsert_billings([billing_record(pet_id=pet_id, payment='%s.50' % pet_id, status=status)
+                         for pet_id, status in ((1, 'open'), (2, 'paid'), (3, 'paid'))])
+        incremental = SummaryViewSet().read_summary()
+        BillingAggregate.objects.update(count=0, amount=0)
+        call_command('rebuild_billing_summary', batch_size=2, stdout=io.StringIO())
+        self.assertEqual(SummaryViewSet().read_summary(), incremental)
+
+
+class InlineThread:
+    def __init__(self, target, args=(), daemon=None):
+        self.target, self.args = target, args
+
+    def start(self):
+        self.target(*self.args)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-swr'},
+})
+class GetOrRefreshTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        for patcher in (mock.patch.object(caching.threading, 'Thread', InlineThread),
+                        mock.patch.object(caching, 'connections')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def expire(self, key):
+        entry = caches['default'].get(key)
+        entry['expires_at'] = 0
+        caches['default'].set(key, entry)
+
+    def test_computes_once_then_serves_hits(self):
+        compute = mock.Mock(return_value=1)
+        self.assertEqual(caching.get_or_refresh('summary', compute, ttl=60), (1, caching.MISS))
+        self.assertEqual(caching.get_or_refresh('summary', compute, ttl=60), (1, caching.HIT))
+        compute.assert_called_once()
+
+    def test_expired_entry_is_served_stale_while_it_is_refreshed(self):
+        caching.get_or_refresh('summary', lambda: 1, ttl=60)
+        self.expire('summary')
+        self.assertEqual(caching.get_or_refresh('summary', lambda: 2, ttl=60), (1, caching.STALE))
+        self.assertEqual(caching.get_or_refresh('summary', lambda: 3, ttl=60), (2, caching.HIT))
+        self.assertIsNone(caches['default'].get('summary:lock'))
+
+    def test_only_the_lock_holder_refreshes(self):
+        caching.get_or_refresh('summary', lambda: 1, ttl=60)
+        self.expire('summary')
+        caches['default'].add('summary:lock', 1)
+        compute = mock.Mock(return_value=2)
+        self.assertEqual(caching.get_or_refresh('summary', compute, ttl=60), (1, caching.STALE))
+        compute.assert_not_called()
+
+    def test_failed_background_refresh_keeps_the_stale_value_and_releases_the_lock(self):
+        caching.get_or_refresh('summary', lambda: 1, ttl=60)
+        self.expire('summary')
+        with self.assertLogs('billing_service.caching', 'ERROR'):
+            caching.get_or_refresh('summary', mock.Mock(side_effect=DatabaseError("down")), ttl=60)
+        self.assertEqual(caches['default'].get('summary')['value'], 1)
+        self.assertIsNone(caches['default'].get('summary:lock'))
+
+    def test_cold_miss_computes_locally_when_the_lock_holder_is_too_slow(self):
+        caches['default'].add('summary:lock', 1)
+        with self.assertLogs('billing_service.caching', 'WARNING'):
+            self.assertEqual(caching.get_or_refresh('summary', lambda: 1, ttl=60, wait_timeout=0), (1, caching.MISS))
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+})
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.addCleanup(caches['shared'].clear)
+
+    def worker(self, name):
+        # each LOCATION gets its own L1, like a separate worker process
+        return TwoTierCache(name, {'TIMEOUT': 300, 'OPTIONS': {'L2_ALIAS': 'shared', 'SYNC_INTERVAL': 0}})
+
+    def test_writes_evict_other_workers_l1(self):
+        first, second = self.worker('tests-first'), self.worker('tests-second')
+        first.set('summary', 1)
+        self.assertEqual(second.get('summary'), 1)
+        first.set('summary', 2)
+        self.assertEqual(second.get('summary'), 2)
+        first.delete('summary')
+        self.assertIsNone(second.get('summary'))
+
+    def test_l1_does_not_keep_a_value_longer_than_l2(self):
+        first, second = self.worker('tests-ttl-first'), self.worker('tests-ttl-second')
+        first.set('summary', 1, timeout=5)
+        self.assertEqual(second.get('summary'), 1)
+        expires_at = second._store.entries[second.make_key('summary')][1]
+        self.assertLessEqual(expires_at - time.monotonic(), 5)
+
+        # written around the backend, without an expiry
+        caches['shared'].set('other', 2, timeout=1)
+        self.assertEqual(second.get('other'), 2)
+        self.assertGreater(second._store.entries[second.make_key('other')][1] - time.monotonic(), 25)
+
+    def test_expiry_entries_follow_their_value(self):
+        cache = self.worker('tests-expiry')
+        cache.add('lock', 1, timeout=5)
+        cache.touch('lock', timeout=60)
+        self.assertGreater(caches['shared'].get('lock:__two_tier_expires') - time.time(), 55)
+        cache.delete('lock')
+        self.assertIsNone(caches['shared'].get('lock:__two_tier_expires'))
+
+    def test_failed_publish_is_logged_and_counted(self):
+        cache = self.worker('tests-failing')
+        with mock.patch.object(caches['shared'], 'incr', side_effect=ConnectionError("down")), \
+                mock.patch('pet_clinic_common.cache_backends.publish_failures') as failures, \
+                self.assertLogs('pet_clinic_common.cache_backends', 'WARNING'):
+            cache.set('summary', 1)
+        failures.add.assert_called_once_with(1)
+        self.assertEqual(caches['shared'].get('summary'), 1)
+
+
+def log_record(msg='billing %s saved', args=(1,), level=logging.INFO, name='billing_service.views', **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class JsonFormatterTests(SimpleTestCase):
+    def test_formats_the_message_and_extra_fields_as_json(self):
+        record = log_record(status_code=201)
+        record.created, record.msecs = 0, 5
+        entry = json.loads(logging_pipeline.JsonFormatter().format(record))
+        self.assertEqual(entry, {
+            'timestamp': '1970-01-01T00:00:00.005Z',
+            'level': 'INFO',
+            'logger': 'billing_service.views',
+            'message': 'billing 1 saved',
+            'status_code': 201,
+        })
+
+    def test_includes_the_exception(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = log_record(level=logging.ERROR)
+            record.exc_info = sys.exc_info()
+        entry = json.loads(logging_pipeline.JsonFormatter().format(record))
+        self.assertIn('ValueError: boom', entry['exception'])
+
+
+class RateLimitFilterTests(SimpleTestCase):
+    def test_samples_a_message_template_once_it_exceeds_the_rate(self):
+        rate_limit = logging_pipeline.RateLimitFilter(rate=2, period=10, sample_every=3)
+        records = [log_record(args=(i,)) for i in range(8)]
+        passed = [record for record in records if rate_limit.filter(record)]
+        self.assertEqual(passed, [records[0], records[1], records[4], records[7]])
+        # the sampled records carry how many were suppressed before them
+        self.assertEqual([getattr(record, 'suppressed', None) for record in passed], [None, None, 2, 2])
+        self.assertTrue(rate_limit.filter(log_record(msg='another template')))
+
+    def test_warnings_always_pass_and_the_window_resets(self):
+        rate_limit = logging_pipeline.RateLimitFilter(rate=1, period=10, sample_every=100)
+        with mock.patch.object(logging_pipeline.time, 'monotonic', return_value=100):
+            self.assertTrue(rate_limit.filter(log_record()))
+            self.assertFalse(rate_limit.filter(log_record()))
+            self.assertTrue(rate_limit.filter(log_record(level=logging.WARNING)))
+        with mock.patch.object(logging_pipeline.time, 'monotonic', return_value=110):
+            self.assertTrue(rate_limit.filter(log_record()))
+
+
+class BackgroundQueueHandlerTests(SimpleTestCase):
+    def test_records_are_formatted_and_written_by_the_listener(self):
+        stream = io.StringIO()
+        handler = logging_pipeline.BackgroundQueueHandler(stream)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        handler.handle(log_record())
+        self.assertIsNot(handler._listener._thread, None)
+        # stopping the listener drains the queue
+        handler.close()
+        self.assertEqual(stream.getvalue(), 'INFO billing 1 saved\n')
+
+    def test_records_are_dropped_and_counted_when_the_queue_is_full(self):
+        handler = logging_pipeline.BackgroundQueueHandler(io.StringIO(), max_queue_size=1)
+        with mock.patch.object(handler, '_ensure_started'), \
+                mock.patch.object(logging_pipeline, 'dropped_counter') as dropped_counter:
+            handler.handle(log_record())
+            handler.handle(log_record())
+        self.assertEqual(handler.dropped, 1)
+        dropped_counter.add.assert_called_once_with(1)
+
+
+class HealthTests(SimpleTestCase):
+    def test_liveness_does_not_wait_for_start_up(self):
+        with mock.patch.object(type(bootstrap), 'ready', new_callable=mock.PropertyMock, return_value=False):
+            self.assertEqual(self.client.get('/health/').status_code, 200)
+            self.assertEqual(self.client.get('/health/ready/').status_code, 503)
+        with mock.patch.object(type(bootstrap), 'ready', new_callable=mock.PropertyMock, return_value=True):
+            self.assertEqual(self.client.get('/health/ready/').status_code, 200)
@@ -0,0 +1,135 @@
+from django.db import connection, transaction
+from django.db.models import Q
+from .models import Billing, CheckList
+from .signals import apply_billing_deltas
+import os
+
+UNIQUE_FIELDS = ['owner_id', 'pet_id', 'type']
+UPDATE_FIELDS = ['type_name', 'payment', 'status', 'invalid_type_name']
+ROW_FIELDS = ['id', 'owner_id', 'pet_id', 'type', 'status', 'payment']
+# OR-ed key lookups per query, well below SQLite's expression depth limit
+KEY_LOOKUP_BATCH_SIZE = 200
+
+
+def billing_key(values):
+    return (values['owner_id'], values['pet_id'], values['type'])
+
+
+def upsert_billings(records, update_fields=UPDATE_FIELDS):
+    """
+    Insert or update billings on the (owner_id, pet_id, type) unique key in one transaction.
+
+    `records` are validated field dicts with distinct keys. bulk_create bypasses
+    Billing.save() and the model signals, so the invalid type name flag and the
+    summary aggregates are maintained here for the whole batch.
+    Existing rows only get `update_fields` overwritten.
+    Returns a list of (billing, created) in the order of `records`.
+    """
+    if not records:
+        return []
+    keys = [billing_key(record) for record in records]
+    invalid = set(
+        CheckList.objects.filter(invalid_name__in={record['type_name'] for record in records})
+        .values_list('invalid_name', flat=True)
+    )
+    billings = dict(zip(keys, (
+        Billing(**record, invalid_type_name=record['type_name'] in invalid)
+        for record in records
+    )))
+    batch_size = int(os.getenv("BILLING_BULK_BATCH_SIZE", 500))
+
+    with transaction.atomic():
+        previous = rows_by_key(keys, lock=True)
+        inserted = {}
+        missing = [key for key in keys if key not in previous]
+        while missing:
+            inserted.update(insert_new([billings[key] for key in sorted(missing)], batch_size))
+            # rows a concurrent transaction inserted since they were looked up are updated instead
+            raced = [key for key in missing if key not in inserted]
+            found = rows_by_key(raced, lock=True) if raced else {}
+            previous.update(found)
+            missing = [key for key in raced if key not in found]
+
+        existing = [billings[key] for key in keys if key in previous]
+        if existing:
+            Billing.objects.bulk_create(
+                existing,
+                update_conflicts=True,
+                unique_fields=UNIQUE_FIELDS,
+                update_fields=update_fields,
+                batch_size=batch_size,
+            )
+
+        deltas = []
+        for key in keys:
+            billing = billings[key]
+            if key in inserted:
+                billing.pk = inserted[key]
+            else:
+                row = previous[key]
+                billing.pk = row['id']
+                # fields left out of update_fields keep their stored values
+                for field in ('status', 'payment'):
+                    if field not in update_fields:
+                        setattr(billing, field, row[field])
+                deltas.append((row['status'], row['type'], -1, row['payment']))
+            deltas.append((billing.status, billing.type, 1, billing.payment))
+        apply_billing_deltas(deltas)
+
+    return [(billings[key], key in inserted) for key in keys]
+
+
+def insert_new(billings, batch_size):
+    """
+    INSERT ... ON CONFLICT DO NOTHING for billings whose key was not found.
+    Returns the ids of the rows actually inserted by key; a key that conflicted was
+    inserted by another transaction in the meantime.
+    """
+    opts = Billing._meta
+    quote = connection.ops.quote_name
+    fields = [field for field in opts.concrete_fields if not field.primary_key]
+    columns = ', '.join(quote(field.column) for field in fields)
+    placeholders = '(%s)' % ', '.join(['%s'] * len(fields))
+    conflict = ', '.join(quote(opts.get_field(name).column) for name in UNIQUE_FIELDS)
+    inserted = {}
+    with connection.cursor() as cursor:
+        for start in range(0, len(billings), batch_size):
+            batch = billings[start:start + batch_size]
+            cursor.execute(
+                'INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) DO NOTHING RETURNING %s, %s' % (
+                    quote(opts.db_table), columns, ', '.join([placeholders] * len(batch)),
+                    conflict, quote(opts.pk.column), conflict,
+                ),
+                [field.get_db_prep_save(getattr(billing, field.attname), connection) for billing in batch for field in fields],
+            )
+            for pk, *key in cursor.fetchall():
+                inserted[tuple(key)] = pk
+    for billing in billings:
+        billing._state.adding = False
+        billing._state.db = connection.alias
+    return inserted
+
+
+def rows_by_key(keys, lock=False):
+    """
+    Billing rows by key for exactly the given keys. With `lock` the rows are locked FOR UPDATE
+    in id order, so batches with overlapping keys queue up behind each other instead of deadlocking.
+    """
+    keys = sorted(set(keys))
+    rows = {}
+    for start in range(0, len(keys), KEY_LOOKUP_BATCH_SIZE):
+        condition = Q()
+        for owner_id, pet_id, type in keys[start:start + KEY_LOOKUP_BATCH_SIZE]:
+            condition |= Q(owner_id=owner_id, pet_id=pet_id, type=type)
+        for row in Billing.objects.filter(condition).values(*ROW_FIELDS):
+            rows[billing_key(row)] = row
+    if lock and rows:
+        locked = (
+            Billing.objects.select_for_update()
+            .filter(id__in=[row['id'] for row in rows.values()])
+            .order_by('id')
+            .values(*ROW_FIELDS)
+        )
+        wanted = set(keys)
+        rows = {billing_key(row): row for row in locked if billing_key(row) in wanted}
+    return rows
@@ -1,13 +1,20 @@
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Subquery, Count, Sum
+from rest_framework.utils.encoders import JSONEncoder
+from django.db import transaction
 from django.utils import timezone
-from django.core.cache import cache
-from .models import Billing,CheckList
-from .serializers import BillingSerializer
+from django.http import StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from .models import Billing, BillingAggregate
+from .serializers import BillingSerializer, BillingUpsertSerializer
+from .upsert import UPDATE_FIELDS, billing_key, upsert_billings
+from .pagination import BillingCursorPagination
+from .caching import get_or_refresh, MISS, STALE
+from .audit import get_audit_writer
 from opentelemetry import trace
+from pet_clinic_billing_service.bootstrap import bootstrap
 import logging
-import boto3
 import datetime
 import os
 import json
@@ -18,36 +25,29 @@ logger = logging.getLogger(__name__)
 # Create your views here.
 
 class BillingViewSet(viewsets.ViewSet):
+    pagination_class = BillingCursorPagination
+
     def list(self, request):
         logger.info("BillingViewSet.list() called - Fetching billing records")
         span = trace.get_current_span()
 
-        # Read all three limits from environment (or use defaults)
-        small_limit = int(os.getenv("SMALL_NAME_LIMIT", 100))      # default 100
-        medium_limit = int(os.getenv("MEDIUM_NAME_LIMIT", 1_000))   # default 1k
-        large_limit = int(os.getenv("LARGE_NAME_LIMIT", 1_000_000))  # default 1M
-
-        # Pick with 1% → large, 10% → medium, otherwise → small
-        r = random.random()
-        if r < 0.01:
-            subquery_limit = large_limit
-            logger.debug(f"Selected large subquery limit: {subquery_limit}")
-        elif r < 0.11:
-            subquery_limit = medium_limit
-            logger.debug(f"Selected medium subquery limit: {subquery_limit}")
-        else:
-            subquery_limit = small_limit
-            logger.debug(f"Selected small subquery limit: {subquery_limit}")
-
-        invalid_names = CheckList.objects.values('invalid_name').distinct()[:subquery_limit]
+        if 'cursor' in request.query_params or 'page_size' in request.query_params:
+            return self.list_page(request, span)
 
         MAX_RESULTS_BOUND = int(os.getenv("MAX_BILLING_RESULTS", 10_000))
         max_results = random.randint(int(MAX_RESULTS_BOUND/10), MAX_RESULTS_BOUND)
-        logger.info(f"Query parameters - subquery_limit: {subquery_limit}, max_results: {max_results}")
+        logger.info("Query parameters - max_results: %s", max_results)
         
-        qs = Billing.objects.exclude(
-            type_name__in=Subquery(invalid_names)
-        )[:max_results]
+        qs = self.valid_billings()[:max_results]
+
+        if request.query_params.get('stream', '').lower() in ('1', 'true'):
+            span.set_attribute("db.stream", True)
+            chunks = self.stream_json(qs)
+            # WSGI servers put the PEP 3333 wsgi.* keys in META, requests served over ASGI have none
+            if 'wsgi.version' not in request.META:
+                # an ASGI server would buffer a sync iterator, feed it chunk by chunk instead
+                chunks = self.stream_async(chunks)
+            return StreamingHttpResponse(chunks, content_type='application/json')
 
 
         # force the DB query and count rows
@@ -56,9 +56,8 @@ class BillingViewSet(viewsets.ViewSet):
         objs = list(qs)  
         db_duration_ms = (time.time() - db_start) * 1_000
         record_count = len(objs)
-        logger.info(f"Database query completed - Records: {record_count}, Duration: {db_duration_ms:.2f}ms")
+        logger.info("Database query completed - Records: %s, Duration: %.2fms", record_count, db_duration_ms)
         
-        span.set_attribute("db.subquery_limit", subquery_limit)
         span.set_attribute("db.record_count", record_count)
         span.set_attribute("db.fetch_time_ms", db_duration_ms)
 
@@ -66,93 +65,225 @@ class BillingViewSet(viewsets.ViewSet):
         ser_start = time.time()
         serializer = BillingSerializer(objs, many=True)
         ser_duration_ms = (time.time() - ser_start) * 1_000
-        logger.debug(f"Serialization completed - Duration: {ser_duration_ms:.2f}ms")
+        logger.debug("Serialization completed - Duration: %.2fms", ser_duration_ms)
         span.set_attribute("serialization.time_ms", ser_duration_ms)
 
-        logger.info(f"BillingViewSet.list() completed successfully - Returned {record_count} records")
+        logger.info("BillingViewSet.list() completed successfully - Returned %s records", record_count)
         return Response(serializer.data)
 
+    def list_page(self, request, span):
+        paginator = self.pagination_class()
+
+        # keyset page: a bounded range scan on the primary key, no OFFSET
+        db_start = time.time()
+        objs = paginator.paginate_queryset(self.valid_billings(), request, view=self)
+        db_duration_ms = (time.time() - db_start) * 1_000
+        record_count = len(objs)
+        logger.info("Database page query completed - Records: %s, Duration: %.2fms", record_count, db_duration_ms)
+
+        span.set_attribute("db.record_count", record_count)
+        span.set_attribute("db.fetch_time_ms", db_duration_ms)
+        span.set_attribute("db.page_size", paginator.get_page_size(request))
+
+        ser_start = time.time()
+        serializer = BillingSerializer(objs, many=True)
+        response = paginator.get_paginated_response(serializer.data)
+        ser_duration_ms = (time.time() - ser_start) * 1_000
+        span.set_attribute("serialization.time_ms", ser_duration_ms)
+
+        logger.info("BillingViewSet.list() completed successfully - Returned page of %s records", record_count)
+        return response
+
+    def stream_json(self, qs):
+        # Walk the rows with a server-side cursor and emit the JSON array one
+        # chunk at a time, so only `chunk_size` model instances are alive at once.
+        # The 200 status is sent before the first row: if the query fails midway the
+        # array is closed with a final {"error": ...} element instead, so clients must
+        # check that the body parses and that its last element is not an error marker.
+        chunk_size = int(os.getenv("BILLING_STREAM_CHUNK_SIZE", 2_000))
+        encoder = JSONEncoder()
+        record_count = 0
+        chunk = []
+
+        yield '['
+        try:
+            for obj in qs.iterator(chunk_size=chunk_size):
+                chunk.append(obj)
+                if len(chunk) == chunk_size:
+                    yield self.encode_chunk(encoder, chunk, record_count)
+                    record_count += len(chunk)
+                    chunk = []
+            if chunk:
+                yield self.encode_chunk(encoder, chunk, record_count)
+                record_count += len(chunk)
+        except Exception as e:
+            logger.exception("BillingViewSet.list() - Stream aborted after %s records", record_count)
+            span = trace.get_current_span()
+            span.record_exception(e)
+            span.set_status(trace.Status(trace.StatusCode.ERROR, "stream aborted"))
+            marker = encoder.encode({'error': 'stream aborted, the results are incomplete', 'records_sent': record_count})
+            yield (',' if record_count else '') + marker + ']'
+            return
+        yield ']'
+        logger.info("BillingViewSet.list() completed successfully - Streamed %s records", record_count)
+
+    async def stream_async(self, chunks):
+        # thread sensitive: the server-side cursor must stay on the request's DB connection
+        next_chunk = sync_to_async(next, thread_sensitive=True)
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+
+    def encode_chunk(self, encoder, chunk, offset):
+        rows = BillingSerializer(chunk, many=True).data
+        body = ','.join(encoder.encode(row) for row in rows)
+        return body if offset == 0 else ',' + body
+
+    def valid_billings(self):
+        # validity is flagged at write time, so this is a plain index filter
+        return Billing.objects.filter(invalid_type_name=False)
+
     def retrieve(self, request, pk=None, owner_id=None, type=None, pet_id=None):
-        logger.info(f"BillingViewSet.retrieve() called - pk: {pk}, owner_id: {owner_id}, type: {type}, pet_id: {pet_id}")
+        logger.info("BillingViewSet.retrieve() called - pk: %s, owner_id: %s, type: %s, pet_id: %s", pk, owner_id, type, pet_id)
         try:
             billing_obj = None
             if pk is not None:
-                logger.debug(f"Retrieving billing record by ID: {pk}")
+                logger.debug("Retrieving billing record by ID: %s", pk)
                 billing_obj = Billing.objects.get(id=pk)
             else:
-                logger.debug(f"Retrieving billing record by owner_id: {owner_id}, type: {type}, pet_id: {pet_id}")
+                logger.debug("Retrieving billing record by owner_id: %s, type: %s, pet_id: %s", owner_id, type, pet_id)
                 billing_obj = Billing.objects.get(owner_id=owner_id, type=type, pet_id=pet_id)
             
             serializer = BillingSerializer(billing_obj)
-            logger.info(f"BillingViewSet.retrieve() completed successfully - Found billing record")
+            logger.info("BillingViewSet.retrieve() completed successfully - Found billing record")
             return Response(serializer.data)
         except Billing.DoesNotExist:
-            logger.warning(f"BillingViewSet.retrieve() - Billing object not found with given parameters")
+            logger.warning("BillingViewSet.retrieve() - Billing object not found with given parameters")
             return Response({'message': 'Billing object not found'}, status=404)
 
     def create(self, request):
-        logger.info(f"BillingViewSet.create() called - Creating new billing record")
-        logger.debug(f"Request data: {request.data}")
+        logger.info("BillingViewSet.create() called - Creating new billing record")
+        logger.debug("Request data: %s", request.data)
         
         serializer = BillingSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
-            logger.info(f"BillingViewSet.create() - Billing record created successfully, ID: {serializer.data.get('id')}")
+            logger.info("BillingViewSet.create() - Billing record created successfully, ID: %s", serializer.data.get('id'))
             self.log(request.data)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
-        logger.error(f"BillingViewSet.create() - Validation failed: {serializer.errors}")
+        logger.error("BillingViewSet.create() - Validation failed: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def update(self, request, pk=None):
-        logger.info(f"BillingViewSet.update() called - Updating billing record ID: {pk}")
-        logger.debug(f"Request data: {request.data}")
+        logger.info("BillingViewSet.update() called - Updating billing record ID: %s", pk)
+        logger.debug("Request data: %s", request.data)
         
         try:
             billing_obj = Billing.objects.get(id=pk)
             serializer = BillingSerializer(billing_obj, data=request.data)
             if serializer.is_valid():
                 serializer.save()
-                logger.info(f"BillingViewSet.update() - Billing record updated successfully, ID: {pk}")
+                logger.info("BillingViewSet.update() - Billing record updated successfully, ID: %s", pk)
                 self.log(request.data)
                 return Response(serializer.data)
             
-            logger.error(f"BillingViewSet.update() - Validation failed: {serializer.errors}")
+            logger.error("BillingViewSet.update() - Validation failed: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Billing.DoesNotExist:
-            logger.warning(f"BillingViewSet.update() - Billing object not found with ID: {pk}")
+            logger.warning("BillingViewSet.update() - Billing object not found with ID: %s", pk)
             return Response({'message': 'Billing object not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    def upsert(self, request, owner_id=None, pet_id=None, type=None):
+        logger.info("BillingViewSet.upsert() called - owner_id: %s, type: %s, pet_id: %s", owner_id, type, pet_id)
+        logger.debug("Request data: %s", request.data)
+
+        if hasattr(request.data, 'dict'):
+            data = request.data.dict()
+        elif isinstance(request.data, dict):
+            data = dict(request.data)
+        else:
+            logger.error("BillingViewSet.upsert() - Expected a billing record, got %s", request.data.__class__.__name__)
+            return Response({'message': 'Expected a billing record object'}, status=status.HTTP_400_BAD_REQUEST)
+        data.update(owner_id=owner_id, pet_id=pet_id, type=type)
+        update_fields = UPDATE_FIELDS
+        if 'status' not in data:
+            # a new billing starts open, an existing one keeps its status
+            data['status'] = 'open'
+            update_fields = [field for field in UPDATE_FIELDS if field != 'status']
+
+        serializer = BillingUpsertSerializer(data=data)
+        if not serializer.is_valid():
+            logger.error("BillingViewSet.upsert() - Validation failed: %s", serializer.errors)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        [(billing, created)] = upsert_billings([serializer.validated_data], update_fields=update_fields)
+        logger.info("BillingViewSet.upsert() - Billing record %s, ID: %s", 'created' if created else 'updated', billing.pk)
+        self.log(data)
+        return Response(
+            BillingSerializer(billing).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        items = request.data
+        logger.info("BillingViewSet.bulk() called - Upserting billing records")
+        if not isinstance(items, list):
+            return Response({'message': 'Expected a list of billing records'}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = int(os.getenv("BILLING_BULK_MAX_ITEMS", 1_000))
+        if len(items) > max_items:
+            return Response({'message': f'At most {max_items} billing records per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = {}
+        for index, item in enumerate(items):
+            # as with the single upsert, a record without a status keeps the stored one
+            keep_status = isinstance(item, dict) and 'status' not in item
+            serializer = BillingUpsertSerializer(data={**item, 'status': 'open'} if keep_status else item)
+            if not serializer.is_valid():
+                results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+                continue
+            key = billing_key(serializer.validated_data)
+            if key in valid:
+                # the last record for a key wins, as it would with sequential calls
+                results[valid[key][0]] = {'index': valid[key][0], 'status': 'superseded', 'superseded_by': index}
+            valid[key] = (index, serializer.validated_data, keep_status)
+
+        with transaction.atomic():
+            for keep_status, update_fields in (
+                (False, UPDATE_FIELDS),
+                (True, [field for field in UPDATE_FIELDS if field != 'status']),
+            ):
+                group = [(index, data) for index, data, keep in valid.values() if keep == keep_status]
+                upserted = upsert_billings([data for _, data in group], update_fields=update_fields)
+                for (index, _), (billing, created) in zip(group, upserted):
+                    results[index] = {'index': index, 'status': 'created' if created else 'updated', 'id': billing.pk}
+                    self.log(items[index])
+
+        counts = {outcome: 0 for outcome in ('created', 'updated', 'superseded', 'invalid')}
+        for result in results:
+            counts[result['status']] += 1
+        logger.info("BillingViewSet.bulk() completed - %s", counts)
+        return Response({**counts, 'results': results})
+
     def log(self, data):
-        logger.info(f"BillingViewSet.log() called - Logging billing data to DynamoDB")
+        logger.info("BillingViewSet.log() called - Queueing billing data for DynamoDB")
         try:
-            # Initialize a DynamoDB client
-            region = os.environ.get('REGION', 'us-east-1')
-            client = boto3.client('dynamodb', region_name=region)
-            logger.debug(f"DynamoDB client initialized for region: {region}")
-
-            # Define the table name
-            table_name = 'BillingInfo'
             current_time = datetime.datetime.now()
             formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
             
             # Define the item you want to add
             item = {
-                'ownerId': {'S': data['owner_id']},
+                'ownerId': {'S': str(data['owner_id'])},
                 'timestamp': {'S': formatted_time},
                 'billing': {'S': json.dumps(data)},
                 # Add more attributes as needed
             }
 
-            logger.debug(f"Preparing to write to DynamoDB table: {table_name}")
-            # Add the item to the table
-            response = client.put_item(
-                TableName=table_name,
-                Item=item
-            )
-            logger.info(f"BillingViewSet.log() - Successfully logged billing data to DynamoDB, owner_id: {data.get('owner_id')}")
+            # written to the BillingInfo table in batches by the background audit writer
+            get_audit_writer().enqueue(item)
         except Exception as e:
-            logger.error(f"BillingViewSet.log() - Failed to log billing data to DynamoDB: {str(e)}")
+            logger.error("BillingViewSet.log() - Failed to queue billing data for DynamoDB: %s", e)
             # Don't raise the exception to avoid disrupting the main flow
 
 
@@ -169,33 +300,53 @@ class SummaryViewSet(viewsets.ViewSet):
         
         # Use random cache key to simulate high cache miss rate
         cache_key = f'billing_summary_last_7_days_{random.randint(1, num_summaries)}'
-        summary = cache.get(cache_key)
-        
-        if summary is None:
-            # Cache miss
-            span.set_attribute("billing_summary_cache_hit", 0)
-            
-            # Sleep to simulate high latency when there's a cache miss 
-            time.sleep(2)
-            
-            billings = Billing.objects.all()
-            
-            summary = {
-                'total_count': billings.count(),
-                'total_amount': billings.aggregate(Sum('payment'))['payment__sum'] or 0,
-                'period': 'all_time'
-            }
-            
-            cache.set(cache_key, summary, 300)  # Cache for 5 minutes
-        else:
-            # Cache hit
-            span.set_attribute("billing_summary_cache_hit", 1)
+        summary, cache_status = get_or_refresh(cache_key, self.compute_summary, ttl=300)
+
+        span.set_attribute("billing_summary_cache_hit", 0 if cache_status == MISS else 1)
+        span.set_attribute("billing_summary_cache_miss", 1 if cache_status == MISS else 0)
+        span.set_attribute("billing_summary_cache_stale", 1 if cache_status == STALE else 0)
         
         return Response(summary)
 
+    def compute_summary(self):
+        # Sleep to simulate high latency when the summary has to be recomputed
+        time.sleep(2)
+        return self.read_summary()
+
+    def read_summary(self):
+        # a handful of rows kept current on every billing write, independent of table size
+        summary = {
+            'total_count': 0,
+            'total_amount': 0,
+            'by_status': {},
+            'by_type': {},
+            'period': 'all_time'
+        }
+        for aggregate in BillingAggregate.objects.all():
+            if aggregate.dimension == BillingAggregate.STATUS:
+                # every billing has exactly one status, so these rows add up to the totals
+                summary['total_count'] += aggregate.count
+                summary['total_amount'] += aggregate.amount
+                if aggregate.count:
+                    summary['by_status'][aggregate.key] = {'count': aggregate.count, 'amount': aggregate.amount}
+            elif aggregate.dimension == BillingAggregate.TYPE and aggregate.count:
+                summary['by_type'][aggregate.key] = {'count': aggregate.count, 'amount': aggregate.amount}
+        return summary
+
 
 class HealthViewSet(viewsets.ViewSet):
     def list(self, request):
+        # liveness: the process serves requests, start-up steps that are still retrying
+        # must not get it restarted
         logger.info("HealthViewSet.list() called - Health check requested")
         logger.info("HealthViewSet.list() - Service is healthy")
-        return Response({'message':'ok'}, status=status.HTTP_200_OK)
+        return Response({'message':'ok', 'startup': bootstrap.status()}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='ready')
+    def ready(self, request):
+        # readiness: keep traffic away until every start-up step has completed
+        startup = bootstrap.status()
+        if not bootstrap.ready:
+            logger.warning("HealthViewSet.ready() - Start-up not complete: %s", startup)
+            return Response({'message': 'starting', 'startup': startup}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'message': 'ready', 'startup': startup}, status=status.HTTP_200_OK)
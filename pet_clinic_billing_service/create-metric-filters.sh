@@ -83,10 +83,35 @@ EOF
 
 aws logs put-metric-filter --region $REGION --cli-input-json file://metric-filter.json || { rm -f metric-filter.json; exit 1; }
 
+# Create metric filter for stale cache hits served while the summary is refreshed in the background
+cat > metric-filter.json << EOF
+{
+"logGroupName": "aws/spans",
+"filterName": "BillingSummaryCacheStaleHits",
+"filterPattern": "{ $.attributes.['billing_summary_cache_stale'] = \"1\" }",
+"metricTransformations": [
+{
+"metricName": "BillingSummaryCacheStaleHitCount",
+"metricNamespace": "$NAMESPACE",
+"metricValue": "1",
+"unit": "Count",
+"dimensions": {
+"Service": "$.attributes.['aws.local.service']",
+"Environment": "$.attributes.['aws.local.environment']",
+"Operation": "$.attributes.['aws.local.operation']"
+}
+}
+]
+}
+EOF
+
+aws logs put-metric-filter --region $REGION --cli-input-json file://metric-filter.json || { rm -f metric-filter.json; exit 1; }
+
 rm -f metric-filter.json
 
 echo "Metric filters created successfully!"
 echo "Metrics will appear in CloudWatch under the '$NAMESPACE' namespace:"
 echo "- BillingSummaryRequestCount"
 echo "- BillingSummaryCacheHitCount" 
-echo "- BillingSummaryCacheMissCount"
\ No newline at end of file
+echo "- BillingSummaryCacheMissCount"
+echo "- BillingSummaryCacheStaleHitCount"
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Start-up steps of the billing service, run in the background by the shared Bootstrap
+(see pet_clinic_common/bootstrap.py): creating the DynamoDB table, registering with
+Eureka and fetching the database password. Started from BillingServiceConfig.ready().
+"""
+from py_eureka_client import eureka_client
+from pet_clinic_common.bootstrap import BOTO_CONFIG, Bootstrap, eureka_server, get_db_password, local_ip
+import boto3
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def table_exists(table_name, dynamodb_client):
+    try:
+        dynamodb_client.describe_table(TableName=table_name)
+        return True
+    except dynamodb_client.exceptions.ResourceNotFoundException:
+        return False
+
+def create_dynamodb_table():
+    # Initialize a DynamoDB client
+    dynamodb = boto3.client('dynamodb', region_name=os.environ.get('REGION', 'us-east-1'), config=BOTO_CONFIG)
+
+    # Define table parameters
+    table_name = 'BillingInfo'
+    read_capacity_units = 2
+    write_capacity_units = 2
+    attribute_definitions = [
+        {
+            'AttributeName': 'ownerId',
+            'AttributeType': 'S'
+        },
+        {
+            'AttributeName': 'timestamp',
+            'AttributeType': 'S'
+        }
+    ]
+    key_schema = [
+        {
+            'AttributeName': 'ownerId',
+            'KeyType': 'HASH'
+        },
+        {
+            'AttributeName': 'timestamp',
+            'KeyType': 'RANGE'
+        }
+    ]
+
+    # Check if table exists
+    if not table_exists(table_name, dynamodb):
+        try:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=key_schema,
+                AttributeDefinitions=attribute_definitions,
+                ProvisionedThroughput={
+                    'ReadCapacityUnits': read_capacity_units,
+                    'WriteCapacityUnits': write_capacity_units
+                }
+            )
+            logger.info("Table %s created successfully", table_name)
+        except dynamodb.exceptions.ResourceInUseException:
+            # another instance created it in the meantime
+            logger.info("Table %s already exists", table_name)
+    else:
+        logger.info("Table %s already exists", table_name)
+
+def register_with_eureka():
+    billing_service_ip = os.environ.get('BILLING_SERVICE_IP') or local_ip()
+    eureka_client.init(
+        eureka_server=eureka_server(),
+        instance_host=billing_service_ip,
+        app_name="billing-service",
+        instance_port=8800,  # Django's default port
+    )
+
+
+def _steps():
+    steps = [
+        ('dynamodb_table', create_dynamodb_table),
+        ('eureka_registration', register_with_eureka),
+    ]
+    if os.environ.get('DATABASE_PROFILE', 'local') == 'postgresql':
+        # warm up, the first connection would otherwise fetch it
+        steps.append(('db_password', get_db_password))
+    return steps
+
+
+bootstrap = Bootstrap(
+    _steps(),
+    base_backoff=float(os.environ.get('BOOTSTRAP_BASE_BACKOFF', 1)),
+    max_backoff=float(os.environ.get('BOOTSTRAP_MAX_BACKOFF', 60)),
+)
@@ -26,5 +26,5 @@ router.register('health', HealthViewSet, basename='health')
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("", include(router.urls)),
-    path('billings/<int:owner_id>/<int:pet_id>/<str:type>/', BillingViewSet.as_view({'get': 'retrieve'}), name='billing-retrieve'),
+    path('billings/<int:owner_id>/<int:pet_id>/<str:type>/', BillingViewSet.as_view({'get': 'retrieve', 'put': 'upsert'}), name='billing-retrieve'),
 ]
@@ -0,0 +1,8 @@
+"""
+Code shared by the Python services (pet_clinic_billing_service, pet_clinic_insurance_service).
+
+Each service directory links to this package, and each Docker image copies it in from the
+`common` build context:
+
+    docker build --build-context common=./pet_clinic_common -t billing-service ./pet_clinic_billing_service
+"""
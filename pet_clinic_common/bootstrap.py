@@ -0,0 +1,151 @@
+"""
+Background start-up of the services.
+
+Registering with Eureka, fetching the database password and the like used to happen at
+import time, so every process (and every manage.py command) blocked on them and failed
+without network access. Each service now lists them as steps of a Bootstrap started from
+its AppConfig.ready(): each step runs in its own daemon thread and is retried with capped
+exponential backoff until it succeeds. Progress is reported by /health/, and
+/health/ready/ answers 503 until every step has completed.
+"""
+from botocore.config import Config
+import boto3
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+READY = 'ready'
+SKIPPED = 'skipped'
+
+# network timeouts of every start-up call, in seconds
+TIMEOUT = float(os.environ.get('BOOTSTRAP_TIMEOUT', 5))
+BOTO_CONFIG = Config(connect_timeout=TIMEOUT, read_timeout=TIMEOUT, retries={'max_attempts': 2})
+
+
+class Bootstrap:
+    """
+    Runs start-up steps in the background, retrying each until it succeeds.
+
+    Steps only run in processes that serve requests: `commands` lists the manage.py
+    commands that count as such, and BOOTSTRAP_ENABLED=true/false overrides the detection.
+    """
+
+    def __init__(self, steps, commands=('runserver',), base_backoff=1, max_backoff=60):
+        self.steps = steps
+        self.commands = commands
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._status = {name: {'state': PENDING, 'attempts': 0, 'error': None} for name, _ in steps}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self, after_fork=False):
+        """
+        Start the steps in this process. Under gunicorn --preload (BOOTSTRAP_AFTER_FORK=true)
+        the call from AppConfig.ready() in the master is ignored, each worker starts its own
+        from the post_fork hook since threads and clients do not survive the fork.
+        """
+        if os.environ.get('BOOTSTRAP_AFTER_FORK') == 'true' and not after_fork:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        if not self.enabled():
+            for status in self._status.values():
+                status['state'] = SKIPPED
+            return
+        for name, step in self.steps:
+            threading.Thread(target=self._run, args=(name, step), name=f"bootstrap-{name}", daemon=True).start()
+
+    def enabled(self):
+        flag = os.environ.get('BOOTSTRAP_ENABLED')
+        if flag is not None:
+            return flag.lower() in ('1', 'true', 'yes')
+        if 'pytest' in sys.modules:
+            return False
+        if os.path.basename(sys.argv[0]) in ('manage.py', 'django-admin'):
+            command = manage_command()
+            if command not in self.commands:
+                return False
+            # the autoreloader's parent process only watches files
+            if command == 'runserver' and '--noreload' not in sys.argv and os.environ.get('RUN_MAIN') != 'true':
+                return False
+        return True
+
+    @property
+    def ready(self):
+        return all(status['state'] != PENDING for status in self._status.values())
+
+    def status(self):
+        with self._lock:
+            return {name: dict(status) for name, status in self._status.items()}
+
+    def _run(self, name, step):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                step()
+            except Exception as e:
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+                logger.warning("Start-up step %s failed (attempt %s), retrying in %.1fs: %s", name, attempt, delay, e)
+                with self._lock:
+                    self._status[name].update(attempts=attempt, error=str(e))
+                time.sleep(delay)
+                continue
+            logger.info("Start-up step %s done after %s attempt(s)", name, attempt)
+            with self._lock:
+                self._status[name].update(state=READY, attempts=attempt, error=None)
+            return
+
+
+def manage_command():
+    """The manage.py command this process runs, None outside of manage.py"""
+    if os.path.basename(sys.argv[0]) in ('manage.py', 'django-admin') and len(sys.argv) > 1:
+        return sys.argv[1]
+    return None
+
+
+def local_ip():
+    # connecting a UDP socket sends nothing, it only picks the outgoing interface
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(TIMEOUT)
+    try:
+        s.connect(("8.8.8.8", 80))
+        return s.getsockname()[0]
+    finally:
+        s.close()
+
+def eureka_server():
+    eureka_server_url = os.environ.get('EUREKA_SERVER_URL', 'localhost')
+    return f"http://{eureka_server_url}:8761/eureka"
+
+
+_db_password = None
+_db_password_lock = threading.Lock()
+
+def get_db_password():
+    """
+    The database password: DB_USER_PASSWORD, or else the SECRET_NAME secret from Secrets Manager.
+    Fetched once per process, on first use.
+    """
+    global _db_password
+    if _db_password is None:
+        with _db_password_lock:
+            if _db_password is None:
+                password = os.environ.get('DB_USER_PASSWORD')
+                if not password:
+                    secret_name = os.environ.get('SECRET_NAME', 'petclinic-python-dbsecret')
+                    client = boto3.client('secretsmanager', region_name=os.environ.get('REGION', 'us-east-1'), config=BOTO_CONFIG)
+                    password = client.get_secret_value(SecretId=secret_name)['SecretString']
+                    logger.info("Retrieved secret %s from AWS Secrets Manager", secret_name)
+                _db_password = password
+    return _db_password
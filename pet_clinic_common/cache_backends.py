@@ -0,0 +1,209 @@
+"""
+Two-tier cache backend: a bounded in-process LRU (L1) in front of a shared cache (L2).
+
+L2 is any other alias configured in CACHES (Redis in production, the file based cache
+locally). Every write through this backend appends the written key to an invalidation
+log kept in L2; each process replays that log at most every SYNC_INTERVAL seconds and
+evicts the listed keys from its L1, so a worker never serves a value that another worker
+overwrote for longer than that interval. A write that cannot be logged is counted in
+cache.invalidation.publish_failures; other workers may then serve the old value until
+their L1 entry expires (L1_TIMEOUT).
+
+Next to every value L2 keeps the time it expires at, read back with it on an L1 miss,
+so a value is never kept in L1 longer than L2 keeps it. The expiry is compared with the
+local clock, hosts are expected to be NTP synchronised.
+
+Reads are served from memory, but every set/delete costs two L2 round trips on top of
+the write itself (the sequence increment and the log entry), and add/touch/delete one
+more for the expiry, so the backend suits read-mostly keys.
+"""
+from collections import OrderedDict
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from opentelemetry import metrics
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+publish_failures = metrics.get_meter(__name__).create_counter(
+    "cache.invalidation.publish_failures", unit="1",
+    description="Cache writes that could not be added to the invalidation log")
+
+_SEQUENCE_KEY = '__two_tier_invalidation_seq'
+_ENTRY_KEY = '__two_tier_invalidation:%d'
+_EXPIRY_KEY = '%s:__two_tier_expires'
+_CLEAR_ALL = '*'
+_MISSING = object()
+
+# Django builds one cache object per thread, the L1 has to be shared by the whole process
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class _L1Store:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_seq = None
+        self.last_sync = 0.0
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2_ALIAS', 'shared')
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1_000))
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 30))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 1))
+        self._max_backlog = int(options.get('MAX_BACKLOG', 1_000))
+        self._log_timeout = int(options.get('LOG_TIMEOUT', 300))
+        with _stores_lock:
+            self._store = _stores.setdefault(name, _L1Store())
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def get(self, key, default=None, version=None):
+        self._sync()
+        l1_key = self.make_and_validate_key(key, version=version)
+        with self._store.lock:
+            entry = self._store.entries.get(l1_key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._store.entries.move_to_end(l1_key)
+                    return entry[0]
+                del self._store.entries[l1_key]
+        expiry_key = _EXPIRY_KEY % key
+        found = self.l2.get_many([key, expiry_key], version=version)
+        if key not in found:
+            return default
+        # a value stored without its expiry (written around this backend) gets L1_TIMEOUT
+        self._remember(l1_key, found[key], found.get(expiry_key))
+        return found[key]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        expires_at = self.get_backend_timeout(timeout)
+        self.l2.set_many(
+            {key: value, _EXPIRY_KEY % key: expires_at}, timeout=self._l2_timeout(timeout), version=version)
+        self._publish(l1_key)
+        self._remember(l1_key, value, expires_at)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # add() is used for cross-worker locks, it must be decided by L2 alone
+        l1_key = self.make_and_validate_key(key, version=version)
+        added = self.l2.add(key, value, timeout=self._l2_timeout(timeout), version=version)
+        if added:
+            expires_at = self.get_backend_timeout(timeout)
+            self.l2.set(_EXPIRY_KEY % key, expires_at, timeout=self._l2_timeout(timeout), version=version)
+            self._publish(l1_key)
+            self._remember(l1_key, value, expires_at)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.make_and_validate_key(key, version=version)
+        touched = self.l2.touch(key, timeout=self._l2_timeout(timeout), version=version)
+        if touched:
+            self.l2.set(_EXPIRY_KEY % key, self.get_backend_timeout(timeout),
+                        timeout=self._l2_timeout(timeout), version=version)
+        return touched
+
+    def delete(self, key, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        deleted = self.l2.delete(key, version=version)
+        if deleted:
+            self.l2.delete(_EXPIRY_KEY % key, version=version)
+        self._forget(l1_key)
+        self._publish(l1_key)
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        value = self.l2.incr(key, delta, version=version)
+        self._forget(l1_key)
+        self._publish(l1_key)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        self.l2.clear()
+        with self._store.lock:
+            self._store.entries.clear()
+            self._store.last_seq = None
+        self._publish(_CLEAR_ALL)
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+    def _l2_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def _remember(self, l1_key, value, expires_at):
+        ttl = self._l1_timeout if expires_at is None else min(self._l1_timeout, expires_at - time.time())
+        if ttl <= 0:
+            return
+        with self._store.lock:
+            self._store.entries[l1_key] = (value, time.monotonic() + ttl)
+            self._store.entries.move_to_end(l1_key)
+            while len(self._store.entries) > self._l1_max_entries:
+                self._store.entries.popitem(last=False)
+
+    def _forget(self, l1_key):
+        with self._store.lock:
+            self._store.entries.pop(l1_key, None)
+
+    def _publish(self, l1_key):
+        l2 = self.l2
+        try:
+            # incr is not atomic on every backend, add() makes sure no log slot is overwritten
+            for _ in range(10):
+                try:
+                    seq = l2.incr(_SEQUENCE_KEY)
+                except ValueError:
+                    l2.add(_SEQUENCE_KEY, 0, timeout=None)
+                    continue
+                if l2.add(_ENTRY_KEY % seq, l1_key, timeout=self._log_timeout):
+                    return
+            error = 'no free log slot after 10 attempts'
+        except Exception as e:
+            # the write itself went through, only other workers' L1 may lag behind it
+            error = e
+        logger.warning("Could not publish cache invalidation of %s: %s", l1_key, error)
+        publish_failures.add(1)
+
+    def _sync(self):
+        store = self._store
+        now = time.monotonic()
+        if now - store.last_sync < self._sync_interval:
+            return
+        store.last_sync = now
+
+        seq = self.l2.get(_SEQUENCE_KEY, 0)
+        with store.lock:
+            last_seq = store.last_seq
+        if last_seq is None or seq == last_seq:
+            with store.lock:
+                store.last_seq = seq
+            return
+
+        if seq < last_seq or seq - last_seq > self._max_backlog:
+            evicted = None
+        else:
+            log_keys = [_ENTRY_KEY % i for i in range(last_seq + 1, seq + 1)]
+            log = self.l2.get_many(log_keys)
+            evicted = None if len(log) < len(log_keys) or _CLEAR_ALL in log.values() else log.values()
+
+        with store.lock:
+            if evicted is None:
+                # the log was reset, expired or too long to replay: drop everything
+                store.entries.clear()
+            else:
+                for l1_key in evicted:
+                    store.entries.pop(l1_key, None)
+            store.last_seq = seq
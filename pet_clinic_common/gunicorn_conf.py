@@ -0,0 +1,44 @@
+"""
+Gunicorn settings shared by the services, see doc/python_services_serving.md for the
+modes and the defaults. Each service's gunicorn.conf.py sets DJANGO_SETTINGS_MODULE,
+star-imports this module and adds its `bind`:
+
+    gunicorn                                   # WSGI, pre-forked gthread workers
+    GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn    # ASGI on uvicorn
+
+The application is loaded once in the master (preload) and forked into the workers.
+The database connections are closed and the start-up bootstrap is run in post_fork,
+everything else holding sockets or threads re-initialises lazily in each worker.
+"""
+import importlib
+import multiprocessing
+import os
+
+__all__ = [
+    'worker_class', 'wsgi_app', 'workers', 'threads', 'keepalive', 'timeout', 'graceful_timeout',
+    'preload_app', 'accesslog', 'post_fork',
+]
+
+# the Django project package, e.g. pet_clinic_billing_service
+PROJECT = os.environ['DJANGO_SETTINGS_MODULE'].rsplit('.', 1)[0]
+
+# the master only loads the app, start-up network calls belong to the workers
+os.environ["BOOTSTRAP_AFTER_FORK"] = "true"
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+wsgi_app = PROJECT + ('.asgi:application' if 'uvicorn' in worker_class.lower() else '.wsgi:application')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = timeout
+preload_app = True
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+
+
+def post_fork(server, worker):
+    from django.db import connections
+    bootstrap = importlib.import_module(PROJECT + '.bootstrap').bootstrap
+    # a connection opened while loading the app must not be shared with the master
+    connections.close_all()
+    bootstrap.start(after_fork=True)
@@ -0,0 +1,188 @@
+"""
+Non-blocking logging pipeline.
+
+Request threads only run the cheap filters and put the unformatted record on a bounded
+queue; a QueueListener thread per process formats (as JSON by default) and writes it.
+Messages are logged with %-style arguments so that the formatting cost is paid by the
+listener, and only for records that pass the filters. RateLimitFilter keeps repetitive
+messages in check by sampling a message template once it has been logged too often.
+"""
+from logging.handlers import QueueHandler, QueueListener
+from opentelemetry import metrics
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+# attributes of every LogRecord, anything else was passed through `extra`
+_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+dropped_counter = metrics.get_meter(__name__).create_counter(
+    "logging.records.dropped", unit="1", description="Log records dropped because the logging queue was full")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'timestamp': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record, datefmt=None):
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.%03dZ' % record.msecs
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through `rate` records per logger and message template every `period` seconds.
+    Beyond that only every `sample_every`-th record is kept, carrying the number of
+    records suppressed since the previous one. Records at or above `max_level` always pass.
+    """
+
+    def __init__(self, rate=20, period=10, sample_every=100, max_level='WARNING'):
+        super().__init__()
+        self.rate = int(rate)
+        self.period = float(period)
+        self.sample_every = int(sample_every)
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.max_level:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                if len(self._windows) > 10_000:
+                    self._windows.clear()
+                window = self._windows[key] = [now, 0, 0]
+            window[1] += 1
+            if window[1] <= self.rate:
+                return True
+            window[2] += 1
+            if window[2] < self.sample_every:
+                return False
+            record.suppressed = window[2] - 1
+            window[2] = 0
+            return True
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    QueueHandler that owns its QueueListener and the handler it writes to.
+
+    The listener thread is started lazily per process, so pre-forked workers each get
+    their own. When the queue is full the record is dropped rather than blocking, and
+    counted in `dropped` and the logging.records.dropped metric.
+    """
+
+    def __init__(self, stream=None, max_queue_size=10_000):
+        super().__init__(queue.Queue(maxsize=int(max_queue_size)))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # formatting happens on the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # the record stays in process, so it is queued unformatted
+        return record
+
+    def enqueue(self, record):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            dropped_counter.add(1)
+
+    def close(self):
+        listener = self._listener
+        if listener is not None and self._pid == os.getpid():
+            listener.stop()
+            self._listener = None
+        super().close()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # forked: the parent's listener may have held the queue's lock
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self._stop)
+
+    def _stop(self):
+        listener = self._listener
+        if listener is not None and self._pid == os.getpid():
+            listener.stop()
+            self._listener = None
+
+
+def logging_config(level='WARNING', fmt='json', rate=20, period=10, sample_every=100, max_queue_size=10_000,
+                   loggers=()):
+    """
+    LOGGING setting for the pipeline, every record ends up in the root logger. The root
+    logger stays at Python's default WARNING, so third-party libraries are as quiet as
+    before; django and the application `loggers` log from `level` up.
+    """
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'json': {'()': JsonFormatter},
+            'text': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+        },
+        'filters': {
+            'rate_limit': {
+                '()': RateLimitFilter,
+                'rate': rate,
+                'period': period,
+                'sample_every': sample_every,
+            },
+        },
+        'handlers': {
+            'console': {
+                '()': BackgroundQueueHandler,
+                'max_queue_size': max_queue_size,
+                'formatter': fmt,
+                'filters': ['rate_limit'],
+            },
+        },
+        'root': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+        'loggers': {
+            'django': {
+                'level': 'INFO',
+            },
+            **{name: {'level': level} for name in loggers},
+        },
+    }
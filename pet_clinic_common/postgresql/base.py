@@ -0,0 +1,11 @@
+from django.db.backends.postgresql import base
+from pet_clinic_common.bootstrap import get_db_password
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL backend that looks the password up when the first connection is made."""
+
+    def get_connection_params(self):
+        if not self.settings_dict['PASSWORD']:
+            self.settings_dict['PASSWORD'] = get_db_password()
+        return super().get_connection_params()
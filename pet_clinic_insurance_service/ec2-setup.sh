@@ -40,4 +40,5 @@ export OTEL_RESOURCE_ATTRIBUTES="service.name=$SVC_NAME"
 
 python3 manage.py migrate  
 python3 manage.py loaddata initial_data.json
+opentelemetry-instrument python3 manage.py dispatch_billing_outbox &
 opentelemetry-instrument python3 manage.py runserver 0.0.0.0:8000 --noreload
\ No newline at end of file
@@ -0,0 +1,15 @@
+"""
+Gunicorn settings for serving the insurance service in production, the shared ones are in
+pet_clinic_common/gunicorn_conf.py. See doc/python_services_serving.md for the modes and
+the defaults.
+
+    gunicorn                                   # WSGI, pre-forked gthread workers
+    GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn    # ASGI on uvicorn
+"""
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pet_clinic_insurance_service.settings")
+
+from pet_clinic_common.gunicorn_conf import *  # noqa: E402,F401,F403
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
@@ -13,7 +13,7 @@ export ACCOUNT_ID=`aws sts get-caller-identity | jq .Account -r`
 export ECR_URL=${ACCOUNT_ID}.dkr.ecr.${REGION}.amazonaws.com
 aws ecr get-login-password --region ${REGION} | docker login --username AWS --password-stdin ${ECR_URL}
 
-docker build -t insurance-service . --no-cache
+docker build --build-context common=../pet_clinic_common -t insurance-service . --no-cache
 docker tag insurance-service:latest ${ECR_URL}/python-petclinic-insurance-service:latest
 docker push ${ECR_URL}/python-petclinic-insurance-service:latest
 
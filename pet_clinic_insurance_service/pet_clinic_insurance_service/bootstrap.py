@@ -0,0 +1,48 @@
+"""
+Start-up steps of the insurance service, run in the background by the shared Bootstrap
+(see pet_clinic_common/bootstrap.py): registering with Eureka and fetching the database
+password. Started from ServiceConfig.ready().
+"""
+from py_eureka_client import eureka_client
+from pet_clinic_common.bootstrap import Bootstrap, eureka_server, get_db_password, local_ip, manage_command
+import os
+
+
+def register_with_eureka():
+    insurance_service_ip = os.environ.get('INSURANCE_SERVICE_IP') or local_ip()
+    eureka_client.init(
+        eureka_server=eureka_server(),
+        instance_host=insurance_service_ip,
+        app_name="insurance-service",
+        instance_port=8000,  # Django's default port
+    )
+
+def discover_with_eureka():
+    eureka_client.init(
+        eureka_server=eureka_server(),
+        app_name="insurance-service",
+        should_register=False,
+        should_discover=True,
+    )
+
+
+def _steps():
+    if manage_command() == 'dispatch_billing_outbox':
+        # the dispatcher would register under the web server's instance id, its heartbeats
+        # would keep a dead web server listed and its shutdown would cancel a live one
+        steps = [('eureka_discovery', discover_with_eureka)]
+    else:
+        steps = [('eureka_registration', register_with_eureka)]
+    if os.environ.get('DATABASE_PROFILE', 'local') == 'postgresql':
+        # warm up, the first connection would otherwise fetch it
+        steps.append(('db_password', get_db_password))
+    return steps
+
+
+bootstrap = Bootstrap(
+    _steps(),
+    # the outbox dispatcher looks billing-service up through Eureka
+    commands=('runserver', 'dispatch_billing_outbox'),
+    base_backoff=float(os.environ.get('BOOTSTRAP_BASE_BACKOFF', 1)),
+    max_backoff=float(os.environ.get('BOOTSTRAP_MAX_BACKOFF', 60)),
+)
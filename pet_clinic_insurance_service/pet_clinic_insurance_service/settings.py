@@ -12,8 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
-import sys
-import boto3
+from pet_clinic_common.logging_pipeline import logging_config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -75,33 +74,6 @@ TEMPLATES = [
 WSGI_APPLICATION = "pet_clinic_insurance_service.wsgi.application"
 
 
-# Get secret name and region from environment or use defaults
-SECRET_NAME = os.environ.get('SECRET_NAME', 'petclinic-python-dbsecret')
-REGION = os.environ.get('REGION', 'us-east-1')
-
-def get_secret_value(secret_name: str, region_name: str) -> str:
-    """
-    Retrieve a secret string from AWS Secrets Manager.
-    """
-    client = boto3.client('secretsmanager', region_name=region_name)
-    response = client.get_secret_value(SecretId=secret_name)
-    return response['SecretString'] 
-
-
-env_db_password = os.environ.get('DB_USER_PASSWORD')
-
-if env_db_password:
-    DB_PASSWORD = env_db_password
-else:
-    # Retrieve from Secrets Manager
-    try:
-        DB_PASSWORD = get_secret_value(SECRET_NAME, REGION)
-        print(f"Retrieved secret '{SECRET_NAME}' from AWS Secrets Manager {DB_PASSWORD}")
-    except Exception as e:
-        # Print the error
-        print(f"Error retrieving secret '{SECRET_NAME}' from AWS Secrets Manager: {e}", file=sys.stderr)
-
-
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 DATABASES = {
@@ -111,10 +83,11 @@ DATABASES = {
         "NAME": BASE_DIR / "db.sqlite3",
     },
     "postgresql":{
-        "ENGINE": "django.db.backends.postgresql",
+        # fetches the password from Secrets Manager on first connect unless DB_USER_PASSWORD is set
+        "ENGINE": "pet_clinic_common.postgresql",
         "NAME": os.environ.get('DB_NAME'),
         "USER": os.environ.get('DB_USER'),
-        "PASSWORD": DB_PASSWORD,
+        "PASSWORD": os.environ.get('DB_USER_PASSWORD', ''),
         "HOST": os.environ.get("DB_SERVICE_HOST"),
         "PORT": os.environ.get("DB_SERVICE_PORT"),
     }
@@ -123,24 +96,49 @@ DATABASES = {
 default_database = os.environ.get('DATABASE_PROFILE', 'local')
 DATABASES['default'] = DATABASES[default_database]
 
-LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'handlers': {
-        'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# "default" is a per-process LRU (L1) in front of the "shared" cache (L2), which is
+# Redis when CACHE_REDIS_URL is set and a file based cache on the local host otherwise.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+CACHES = {
+    "default": {
+        "BACKEND": "pet_clinic_common.cache_backends.TwoTierCache",
+        "LOCATION": "insurance",
+        "TIMEOUT": 300,
+        "OPTIONS": {
+            "L2_ALIAS": "shared",
+            "L1_MAX_ENTRIES": int(os.environ.get('CACHE_L1_MAX_ENTRIES', 1_000)),
+            "L1_TIMEOUT": int(os.environ.get('CACHE_L1_TIMEOUT', 30)),
+            "SYNC_INTERVAL": float(os.environ.get('CACHE_SYNC_INTERVAL', 1)),
         },
     },
-    'loggers': {
-        'django': {
-            'handlers': ['console'],
-            'level': 'INFO',
-            'propagate': True,
-        },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": CACHE_REDIS_URL,
+        "KEY_PREFIX": "insurance",
+    } if CACHE_REDIS_URL else {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get('CACHE_DIR', '/tmp/pet_clinic_insurance_cache'),
     },
 }
 
+# Records are written by a background thread as JSON (LOG_FORMAT=text for plain lines),
+# repetitive messages are sampled once they exceed LOG_RATE_LIMIT per LOG_RATE_PERIOD seconds.
+# LOG_LEVEL applies to the service's own loggers, other libraries only log warnings and up.
+# It defaults to WARNING, as the service logged before; LOG_LEVEL=INFO adds a few lines per request.
+LOGGING = logging_config(
+    level=os.environ.get('LOG_LEVEL', 'WARNING'),
+    fmt=os.environ.get('LOG_FORMAT', 'json'),
+    rate=int(os.environ.get('LOG_RATE_LIMIT', 20)),
+    period=float(os.environ.get('LOG_RATE_PERIOD', 10)),
+    sample_every=int(os.environ.get('LOG_SAMPLE_EVERY', 100)),
+    max_queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10_000)),
+    loggers=['service', 'pet_clinic_insurance_service', 'pet_clinic_common'],
+)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
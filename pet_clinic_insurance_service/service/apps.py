@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ServiceConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "service"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from pet_clinic_insurance_service.bootstrap import bootstrap
+        bootstrap.start()
@@ -0,0 +1,48 @@
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from .models import Insurance
+from .serializers import InsuranceSerializer
+import hashlib
+import threading
+import uuid
+
+VERSION_KEY = 'insurance_catalog:version'
+
+
+class Catalog:
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body
+        self.etag = '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+_catalog = None
+_lock = threading.Lock()
+
+
+def get_catalog():
+    """
+    The insurance catalog rendered to JSON bytes, rebuilt only when its version changes.
+
+    The version lives in the shared cache, so an invalidation in one worker reaches
+    every other worker through the cache's own cross-worker invalidation.
+    """
+    global _catalog
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    catalog = _catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+    with _lock:
+        if _catalog is None or _catalog.version != version:
+            insurances = Insurance.objects.order_by('id')
+            _catalog = Catalog(version, JSONRenderer().render(InsuranceSerializer(insurances, many=True).data))
+        return _catalog
+
+
+def invalidate_catalog():
+    global _catalog
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    _catalog = None
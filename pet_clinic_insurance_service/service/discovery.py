@@ -0,0 +1,141 @@
+from concurrent.futures import Future
+from contextlib import contextmanager
+from py_eureka_client import eureka_client
+import itertools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+
+
+class ServiceResolver:
+    """
+    Resolves a Eureka application name to one of its instance base URLs.
+
+    Instance lists are cached for `ttl` seconds and refreshed by a background thread,
+    so lookups stay off the request path. A missing or long-stale list is fetched outside
+    the lock, once per service however many requests are waiting for it. Instances are
+    picked round-robin or by the fewest outstanding requests, and an instance that fails
+    is ejected for `ejection_time` seconds (unless every instance is ejected).
+    """
+
+    def __init__(self, ttl=30, ejection_time=30, strategy=ROUND_ROBIN):
+        self.ttl = ttl
+        self.ejection_time = ejection_time
+        self.strategy = strategy
+        self._instances = {}
+        self._counters = {}
+        self._outstanding = {}
+        self._ejected = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._pid = None
+
+    def resolve(self, service_name):
+        """Pick an instance without tracking the request."""
+        urls = self._cached_urls(service_name)
+        with self._lock:
+            return self._pick(service_name, urls)
+
+    @contextmanager
+    def instance(self, service_name):
+        """Pick an instance for the duration of a request, ejecting it if the request raises."""
+        urls = self._cached_urls(service_name)
+        with self._lock:
+            url = self._pick(service_name, urls)
+            self._outstanding[url] = self._outstanding.get(url, 0) + 1
+        try:
+            yield url
+        except Exception:
+            self.report_failure(url)
+            raise
+        finally:
+            with self._lock:
+                self._outstanding[url] -= 1
+
+    def report_failure(self, url):
+        logger.warning("Ejecting service instance %s for %ss", url, self.ejection_time)
+        with self._lock:
+            self._ejected[url] = time.monotonic() + self.ejection_time
+
+    def _pick(self, service_name, urls):
+        now = time.monotonic()
+        healthy = [url for url in urls if self._ejected.get(url, 0) <= now] or urls
+        if self.strategy == LEAST_OUTSTANDING:
+            return min(healthy, key=lambda url: self._outstanding.get(url, 0))
+        counter = self._counters.setdefault(service_name, itertools.count())
+        return healthy[next(counter) % len(healthy)]
+
+    def _cached_urls(self, service_name):
+        self._ensure_refresher()
+        with self._lock:
+            cached = self._instances.get(service_name)
+            if cached is not None and time.monotonic() - cached[1] <= self.ttl * 2:
+                return cached[0]
+            # first lookup, or the background refresh has been failing for a while
+            future = self._inflight.get(service_name)
+            leader = future is None
+            if leader:
+                future = self._inflight[service_name] = Future()
+        if leader:
+            try:
+                urls = self._fetch(service_name)
+            except Exception as e:
+                with self._lock:
+                    self._inflight.pop(service_name, None)
+                future.set_exception(e)
+            else:
+                with self._lock:
+                    self._inflight.pop(service_name, None)
+                    self._instances[service_name] = (urls, time.monotonic())
+                future.set_result(urls)
+        return future.result()
+
+    def _fetch(self, service_name):
+        client = eureka_client.get_client()
+        instances = client.applications.get_application(service_name.upper()).instances
+        urls = [
+            'http://' + instance.ipAddr + ":" + str(instance.port.port) + "/"
+            for instance in instances
+            if getattr(instance, 'status', 'UP') == 'UP'
+        ]
+        logger.debug("Resolved %s instances: %s", service_name, urls)
+        if not urls:
+            raise ValueError("no valid instance found for service '%s'" % service_name)
+        return urls
+
+    def _ensure_refresher(self):
+        # started lazily so that each pre-forked worker runs its own thread
+        if self._pid == os.getpid() and self._refresher is not None and self._refresher.is_alive():
+            return
+        if self._pid != os.getpid():
+            # fetches in flight belong to the parent after a fork
+            self._inflight = {}
+        self._pid = os.getpid()
+        self._refresher = threading.Thread(target=self._refresh_loop, name="service-resolver", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.ttl / 2)
+            for service_name in list(self._instances):
+                try:
+                    urls = self._fetch(service_name)
+                except Exception as e:
+                    logger.warning("Refreshing instances of %s failed: %s", service_name, e)
+                    continue
+                with self._lock:
+                    self._instances[service_name] = (urls, time.monotonic())
+
+
+resolver = ServiceResolver(
+    ttl=float(os.environ.get('DISCOVERY_TTL', 30)),
+    ejection_time=float(os.environ.get('DISCOVERY_EJECTION_TIME', 30)),
+    strategy=os.environ.get('DISCOVERY_STRATEGY', ROUND_ROBIN),
+)
@@ -0,0 +1,35 @@
+from .models import PetInsurance
+import os
+
+UPDATE_FIELDS = ['insurance_id', 'insurance_name', 'price']
+
+
+def upsert_pet_insurances(records):
+    """
+    Insert or update pet insurances on the unique pet_id in one statement per batch.
+
+    `records` are validated field dicts with distinct pet ids. Call inside a transaction.
+    Returns a list of (pet_insurance, created) in the order of `records`.
+    """
+    if not records:
+        return []
+    pet_ids = [record['pet_id'] for record in records]
+    existing = set(
+        PetInsurance.objects.select_for_update().filter(pet_id__in=pet_ids).values_list('pet_id', flat=True)
+    )
+    pet_insurances = [PetInsurance(**record) for record in records]
+    PetInsurance.objects.bulk_create(
+        pet_insurances,
+        update_conflicts=True,
+        unique_fields=['pet_id'],
+        update_fields=UPDATE_FIELDS,
+        batch_size=int(os.getenv("PET_INSURANCE_BULK_BATCH_SIZE", 500)),
+    )
+
+    # not every backend returns the primary keys of upserted rows
+    if any(pet_insurance.pk is None for pet_insurance in pet_insurances):
+        ids = dict(PetInsurance.objects.filter(pet_id__in=pet_ids).values_list('pet_id', 'id'))
+        for pet_insurance in pet_insurances:
+            pet_insurance.pk = ids[pet_insurance.pet_id]
+
+    return [(pet_insurance, pet_insurance.pet_id not in existing) for pet_insurance in pet_insurances]
@@ -0,0 +1,109 @@
+from opentelemetry import metrics
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import logging
+import os
+import requests
+import threading
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+class HttpClient:
+    """
+    Process-wide keep-alive HTTP client for calls to the other pet clinic services.
+
+    One requests.Session with a pooled adapter is shared by all threads of a worker
+    (and rebuilt after a fork). Every call gets connect/read timeouts, and idempotent
+    methods are retried on connection errors and 502/503/504 with jittered backoff.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=20, connect_timeout=2, read_timeout=10,
+                 retries=3, backoff_factor=0.1, backoff_jitter=0.1):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_jitter,
+            allowed_methods=IDEMPOTENT_METHODS,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,
+        )
+        self._session = None
+        self._adapter = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        meter.create_observable_gauge(
+            "insurance.http.pool.in_use", callbacks=[self._observe_in_use], unit="1",
+            description="Pooled connections currently checked out of the pool, per host")
+        meter.create_observable_gauge(
+            "insurance.http.pool.open", callbacks=[self._observe_open], unit="1",
+            description="Connections opened by the pool since start, per host")
+        meter.create_observable_gauge(
+            "insurance.http.pool.max_size", callbacks=[self._observe_max_size], unit="1",
+            description="Maximum number of pooled connections per host")
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    @property
+    def session(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        max_retries=self.retry,
+                    )
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session, self._adapter = session, adapter
+                    self._pid = os.getpid()
+        return self._session
+
+    def _pools(self):
+        if self._adapter is None:
+            return []
+        pools = self._adapter.poolmanager.pools
+        return [(key, pools[key]) for key in pools.keys()]
+
+    def _observe_in_use(self, options):
+        for key, pool in self._pools():
+            # the pool queue starts with pool_maxsize slots, a checked out connection leaves one empty
+            slots = pool.pool
+            if slots is not None:
+                yield metrics.Observation(slots.maxsize - slots.qsize(), {"net.peer.name": f"{key.key_host}:{key.key_port}"})
+
+    def _observe_open(self, options):
+        for key, pool in self._pools():
+            yield metrics.Observation(pool.num_connections, {"net.peer.name": f"{key.key_host}:{key.key_port}"})
+
+    def _observe_max_size(self, options):
+        yield metrics.Observation(self.pool_maxsize)
+
+
+http_client = HttpClient(
+    pool_connections=int(os.environ.get('HTTP_POOL_CONNECTIONS', 10)),
+    pool_maxsize=int(os.environ.get('HTTP_POOL_MAXSIZE', 20)),
+    connect_timeout=float(os.environ.get('HTTP_CONNECT_TIMEOUT', 2)),
+    read_timeout=float(os.environ.get('HTTP_READ_TIMEOUT', 10)),
+    retries=int(os.environ.get('HTTP_RETRIES', 3)),
+)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from service.outbox import dispatch_pending
+import time
+
+
+class Command(BaseCommand):
+    help = "Send pending billing outbox entries to billing-service in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to sleep when the outbox is empty")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the outbox and exit instead of polling")
+
+    def handle(self, *args, **options):
+        while True:
+            handled = dispatch_pending(batch_size=options['batch_size'])
+            if handled:
+                self.stdout.write(f"Dispatched {handled} billing outbox entries")
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.3 on 2026-10-17 14:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("service", "0002_alter_petinsurance_pet_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BillingOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("owner_id", models.IntegerField()),
+                ("pet_id", models.IntegerField()),
+                ("type", models.CharField(max_length=200)),
+                ("type_name", models.CharField(max_length=200)),
+                ("payment", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("attempts", models.IntegerField(default=0)),
+                (
+                    "available_at",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "db_table": "billing_outbox",
+            },
+        ),
+    ]
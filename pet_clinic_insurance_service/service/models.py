@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 class Insurance(models.Model):
@@ -18,4 +19,22 @@ class PetInsurance(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
     def __str__(self):
-        return self.id
\ No newline at end of file
+        return self.id
+
+class BillingOutbox(models.Model):
+    """
+    Billing to generate for a pet insurance write, stored in the same transaction
+    and sent to billing-service later by the dispatch_billing_outbox command.
+    """
+    owner_id = models.IntegerField()
+    pet_id = models.IntegerField()
+    type = models.CharField(max_length=200)
+    type_name = models.CharField(max_length=200)
+    payment = models.DecimalField(max_digits=10, decimal_places=2)
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'billing_outbox'
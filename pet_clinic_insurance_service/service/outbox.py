@@ -0,0 +1,114 @@
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import BillingOutbox
+from .resilience import DownstreamUnavailable
+from .rest import generate_billings_batch
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_billing(pet_insurance, owner_id, type, type_name):
+    """
+    Record the billing for a pet insurance write. Call inside the transaction that saves it.
+    """
+    entry = outbox_entry(pet_insurance, owner_id, type, type_name)
+    if entry is not None:
+        entry.save()
+    return entry
+
+
+def enqueue_billings(entries):
+    """
+    Record many (pet_insurance, owner_id, type, type_name) billings with one insert.
+    """
+    outbox = [outbox_entry(*entry) for entry in entries]
+    return BillingOutbox.objects.bulk_create([entry for entry in outbox if entry is not None])
+
+
+def outbox_entry(pet_insurance, owner_id, type, type_name):
+    try:
+        owner_id = int(owner_id)
+    except (TypeError, ValueError):
+        logger.warning("Not generating billing for pet_id: %s, invalid owner_id: %s", pet_insurance['pet_id'], owner_id)
+        return None
+    return BillingOutbox(
+        owner_id=owner_id,
+        pet_id=pet_insurance["pet_id"],
+        type=type,
+        type_name=type_name,
+        payment=pet_insurance["price"],
+    )
+
+
+def dispatch_pending(batch_size=100, max_backoff=300, lease=120):
+    """
+    Send one batch of due outbox entries to billing-service. Returns the number of entries handled.
+
+    Entries are claimed in a short transaction that skips rows locked by other dispatchers and
+    leases the claimed ones by pushing their available_at `lease` seconds out; no lock is held
+    while billing-service is called, and a dispatcher that dies mid-batch only delays its
+    entries until the lease runs out. The newest entry per (owner_id, pet_id, type) is sent in
+    one bulk upsert call, which makes the older ones redundant. A failed batch is retried with
+    exponential backoff; a batch rejected by the billing-service circuit breaker waits until
+    the circuit may close again.
+    """
+    entries = claim_due(batch_size, lease)
+    if not entries:
+        return 0
+    try:
+        results = generate_billings_batch([
+            {
+                "owner_id": entry.owner_id,
+                "pet_id": entry.pet_id,
+                "type": entry.type,
+                "type_name": entry.type_name,
+                "payment": str(entry.payment),
+            }
+            for entry in entries
+        ])
+    except DownstreamUnavailable as e:
+        # nothing was sent, wait for the circuit to allow calls again without counting an attempt
+        for entry in entries:
+            entry.available_at = timezone.now() + timedelta(seconds=e.retry_after)
+        BillingOutbox.objects.bulk_update(entries, ['available_at'])
+        logger.info("Billing outbox batch of %s entries deferred: %s", len(entries), e)
+    except Exception as e:
+        for entry in entries:
+            entry.attempts += 1
+            entry.last_error = str(e)
+            entry.available_at = timezone.now() + timedelta(seconds=min(max_backoff, 2 ** entry.attempts))
+        BillingOutbox.objects.bulk_update(entries, ['attempts', 'last_error', 'available_at'])
+        logger.warning("Billing outbox batch of %s entries failed: %s", len(entries), e)
+    else:
+        for entry, result in zip(entries, results):
+            if result['status'] == 'invalid':
+                # retrying cannot fix a rejected record
+                logger.error("Billing outbox entry %s rejected by billing-service: %s", entry.id, result['errors'])
+        BillingOutbox.objects.filter(id__in=[entry.id for entry in entries]).delete()
+    return len(entries)
+
+
+def claim_due(batch_size, lease):
+    """
+    Lease up to `batch_size` due entries to this dispatcher and return the newest one per
+    (owner_id, pet_id, type); the older entries they supersede are deleted.
+    """
+    with transaction.atomic():
+        due = list(
+            BillingOutbox.objects.select_for_update(skip_locked=True)
+            .filter(available_at__lte=timezone.now())
+            .order_by('id')[:batch_size]
+        )
+        if not due:
+            return []
+        latest = {}
+        for entry in due:
+            latest[(entry.owner_id, entry.pet_id, entry.type)] = entry
+        claimed = list(latest.values())
+        superseded = [entry.id for entry in due if latest[(entry.owner_id, entry.pet_id, entry.type)] is not entry]
+        BillingOutbox.objects.filter(id__in=superseded).delete()
+        BillingOutbox.objects.filter(id__in=[entry.id for entry in claimed]).update(
+            available_at=timezone.now() + timedelta(seconds=lease))
+    return claimed
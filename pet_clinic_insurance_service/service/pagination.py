@@ -0,0 +1,50 @@
+from django.core.cache import cache
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+import os
+
+
+class CountedCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the primary key, with a total count that is cached
+    for COUNT_CACHE_TIMEOUT seconds instead of being recounted for every page.
+    """
+    ordering = 'id'
+    page_size = int(os.getenv("INSURANCE_PAGE_SIZE", 100))
+    page_size_query_param = 'page_size'
+    max_page_size = int(os.getenv("INSURANCE_MAX_PAGE_SIZE", 1_000))
+    count_cache_timeout = int(os.getenv("COUNT_CACHE_TIMEOUT", 60))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset):
+        key = f'{queryset.model._meta.label_lower}:count'
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_cache_timeout)
+        return count
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class OptionalPaginationMixin:
+    """
+    Only paginate list requests that ask for it with ?cursor= or ?page_size=,
+    unpaginated clients keep getting a plain list.
+    """
+    pagination_class = CountedCursorPagination
+
+    def paginate_queryset(self, queryset):
+        params = self.request.query_params
+        if 'cursor' not in params and 'page_size' not in params:
+            return None
+        return super().paginate_queryset(queryset)
@@ -0,0 +1,151 @@
+from contextlib import contextmanager
+from opentelemetry import metrics, trace
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+rejected_counter = meter.create_counter(
+    "insurance.downstream.rejected", unit="1",
+    description="Calls to a downstream service rejected by its circuit breaker or bulkhead")
+_guards = []
+
+
+class DownstreamUnavailable(Exception):
+    """A call was rejected without being attempted. `retry_after` is a hint in seconds."""
+
+    def __init__(self, downstream, reason, retry_after):
+        super().__init__(f"{downstream} unavailable: {reason}")
+        self.downstream = downstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class DownstreamGuard:
+    """
+    Circuit breaker plus bulkhead for the calls to one downstream service.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls fail fast
+    for `reset_timeout` seconds; then a single trial call is let through (half-open) and
+    its outcome closes or re-opens the circuit. Independently, at most `max_concurrent`
+    calls run at once and a caller waits at most `max_wait` seconds for a slot, so a slow
+    downstream can tie up only that many workers.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, max_concurrent=10, max_wait=0.1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        _guards.append(self)
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    @contextmanager
+    def call(self):
+        """
+        Guard the enclosed downstream call. Raises DownstreamUnavailable when the call is
+        rejected; any exception raised inside the block counts as a failure.
+        """
+        span = trace.get_current_span()
+        trial = self._admit(span)
+        if not self._slots.acquire(timeout=self.max_wait):
+            if trial:
+                with self._lock:
+                    self._trial_running = False
+            self._reject(span, 'bulkhead_full', self.max_wait)
+        try:
+            yield
+        except Exception:
+            self.record_failure()
+            raise
+        else:
+            self.record_success()
+        finally:
+            self._slots.release()
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Circuit for %s closed", self.name)
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning("Circuit for %s opened after %s failures", self.name, self._failures)
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def _admit(self, span):
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    state, retry_after = OPEN, remaining
+                else:
+                    self._state = HALF_OPEN
+            if self._state == HALF_OPEN:
+                if self._trial_running:
+                    state, retry_after = HALF_OPEN, self.reset_timeout
+                else:
+                    self._trial_running = True
+                    span.set_attribute("downstream.circuit_state", HALF_OPEN)
+                    return True
+            elif self._state == CLOSED:
+                span.set_attribute("downstream.circuit_state", CLOSED)
+                return False
+        span.set_attribute("downstream.circuit_state", state)
+        self._reject(span, 'circuit_open', retry_after)
+
+    def _reject(self, span, reason, retry_after):
+        span.set_attribute("downstream.rejected", reason)
+        rejected_counter.add(1, {"downstream": self.name, "reason": reason})
+        raise DownstreamUnavailable(self.name, reason, retry_after)
+
+
+def _observe_circuit_state(options):
+    for guard in _guards:
+        yield metrics.Observation(STATE_VALUES[guard.state], {"downstream": guard.name})
+
+
+meter.create_observable_gauge(
+    "insurance.downstream.circuit_state", callbacks=[_observe_circuit_state], unit="1",
+    description="Circuit breaker state per downstream service: 0 closed, 1 half-open, 2 open")
+
+
+def guard_from_env(name, prefix):
+    return DownstreamGuard(
+        name,
+        failure_threshold=int(os.environ.get(f'{prefix}_BREAKER_FAILURES', 5)),
+        reset_timeout=float(os.environ.get(f'{prefix}_BREAKER_RESET_TIMEOUT', 30)),
+        max_concurrent=int(os.environ.get(f'{prefix}_MAX_CONCURRENT', 10)),
+        max_wait=float(os.environ.get(f'{prefix}_MAX_WAIT', 0.1)),
+    )
+
+
+billing_guard = guard_from_env("billing-service", 'BILLING')
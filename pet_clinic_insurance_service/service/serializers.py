@@ -9,4 +9,9 @@ class InsuranceSerializer(serializers.ModelSerializer):
 class PetInsuranceSerializer(serializers.ModelSerializer):
     class Meta:
         model = PetInsurance
-        fields = ['id', 'pet_id', 'insurance_id', 'insurance_name', 'price']
\ No newline at end of file
+        fields = ['id', 'pet_id', 'insurance_id', 'insurance_name', 'price']
+
+class PetInsuranceUpsertSerializer(PetInsuranceSerializer):
+    class Meta(PetInsuranceSerializer.Meta):
+        # a bulk enrollment updates the existing insurance of a pet instead of rejecting it
+        extra_kwargs = {'pet_id': {'validators': []}}
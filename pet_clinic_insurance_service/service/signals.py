@@ -0,0 +1,11 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .catalog import invalidate_catalog
+from .models import Insurance
+
+
+@receiver(post_save, sender=Insurance)
+@receiver(post_delete, sender=Insurance)
+def insurance_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_catalog)
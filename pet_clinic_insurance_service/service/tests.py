@@ -1,3 +1,291 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import threading
+import time
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+import requests
+
+from pet_clinic_insurance_service import bootstrap as bootstrap_module
+from pet_clinic_insurance_service.bootstrap import bootstrap
+from . import outbox, rest
+from .discovery import ServiceResolver
+from .http_client import HttpClient
+from .models import BillingOutbox
+from .outbox import enqueue_billing
+from .resilience import CLOSED, HALF_OPEN, OPEN, DownstreamGuard, DownstreamUnavailable
+
+
+def fake_response(status_code, body=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = b'' if body is None else body.encode()
+    return response
+
+
+class DownstreamGuardTests(SimpleTestCase):
+    def call_failing(self, guard):
+        with self.assertRaises(ValueError):
+            with guard.call():
+                raise ValueError("boom")
+
+    def test_opens_after_consecutive_failures(self):
+        guard = DownstreamGuard("test", failure_threshold=2, reset_timeout=30)
+        self.call_failing(guard)
+        self.assertEqual(guard.state, CLOSED)
+        self.call_failing(guard)
+        self.assertEqual(guard.state, OPEN)
+        with self.assertRaises(DownstreamUnavailable) as raised:
+            with guard.call():
+                self.fail("a call went through an open circuit")
+        self.assertEqual(raised.exception.reason, 'circuit_open')
+        self.assertGreater(raised.exception.retry_after, 0)
+
+    def test_success_resets_the_failure_count(self):
+        guard = DownstreamGuard("test", failure_threshold=2)
+        self.call_failing(guard)
+        with guard.call():
+            pass
+        self.call_failing(guard)
+        self.assertEqual(guard.state, CLOSED)
+
+    def test_half_open_lets_a_single_trial_through(self):
+        guard = DownstreamGuard("test", failure_threshold=1, reset_timeout=0)
+        self.call_failing(guard)
+        self.assertEqual(guard.state, HALF_OPEN)
+        with guard.call():
+            with self.assertRaises(DownstreamUnavailable):
+                with guard.call():
+                    pass
+        self.assertEqual(guard.state, CLOSED)
+
+    def test_failed_trial_reopens(self):
+        guard = DownstreamGuard("test", failure_threshold=1, reset_timeout=0)
+        self.call_failing(guard)
+        self.call_failing(guard)
+        guard.reset_timeout = 30
+        self.assertEqual(guard.state, OPEN)
+
+    def test_bulkhead_rejects_when_full(self):
+        guard = DownstreamGuard("test", max_concurrent=1, max_wait=0)
+        with guard.call():
+            with self.assertRaises(DownstreamUnavailable) as raised:
+                with guard.call():
+                    pass
+        self.assertEqual(raised.exception.reason, 'bulkhead_full')
+        self.assertEqual(guard.state, CLOSED)
+
+
+class ServiceResolverTests(SimpleTestCase):
+    def resolver(self, fetch):
+        resolver = ServiceResolver(ttl=30)
+        resolver._ensure_refresher = lambda: None
+        resolver._fetch = fetch
+        return resolver
+
+    def test_concurrent_lookups_share_one_fetch_outside_the_lock(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def fetch(service_name):
+            calls.append(service_name)
+            if service_name == 'billing-service':
+                started.set()
+                release.wait(5)
+            return ['http://%s/' % service_name]
+
+        resolver = self.resolver(fetch)
+        resolver.resolve('customers-service')
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            lookups = [pool.submit(resolver.resolve, 'billing-service') for _ in range(4)]
+            started.wait(5)
+            # cached services resolve while the fetch is still running
+            cached = pool.submit(resolver.resolve, 'customers-service')
+            self.assertEqual(cached.result(timeout=1), 'http://customers-service/')
+            release.set()
+            self.assertEqual({lookup.result() for lookup in lookups}, {'http://billing-service/'})
+        self.assertEqual(calls, ['customers-service', 'billing-service'])
+
+    def test_failed_fetch_is_not_cached(self):
+        fetch = mock.Mock(side_effect=[ValueError("no valid instance"), ['http://billing/']])
+        resolver = self.resolver(fetch)
+        with self.assertRaises(ValueError):
+            resolver.resolve('billing-service')
+        self.assertEqual(resolver.resolve('billing-service'), 'http://billing/')
+
+    def test_failing_instance_is_ejected(self):
+        resolver = self.resolver(lambda service_name: ['http://a/', 'http://b/'])
+        with self.assertRaises(ConnectionError):
+            with resolver.instance('billing-service') as url:
+                raise ConnectionError(url)
+        self.assertEqual({resolver.resolve('billing-service') for _ in range(4)}, {'http://b/'} if url == 'http://a/' else {'http://a/'})
+
+
+class HttpClientTests(SimpleTestCase):
+    def test_in_use_counts_connections_checked_out_of_the_pool(self):
+        release = threading.Event()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                release.wait(5)
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:%s/' % server.server_port
+
+        client = HttpClient(retries=0)
+        in_use = lambda: sum(observation.value for observation in client._observe_in_use(None))
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            requests_in_flight = [pool.submit(client.get, url) for _ in range(2)]
+            for _ in range(100):
+                if in_use() == 2:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(in_use(), 2)
+            release.set()
+            self.assertEqual([request.result().status_code for request in requests_in_flight], [200, 200])
+        self.assertEqual(in_use(), 0)
+
+
+class GenerateBillingsBatchTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(rest.resolver, '_cached_urls', return_value=['http://billing/'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        guard = mock.patch.object(rest, 'billing_guard', DownstreamGuard("billing-test", failure_threshold=1))
+        self.guard = guard.start()
+        self.addCleanup(guard.stop)
+
+    def post(self, response):
+        return mock.patch.object(rest.http_client, 'post', return_value=response)
+
+    def test_returns_the_per_item_results(self):
+        with self.post(fake_response(200, '{"results": [{"index": 0, "status": "created"}]}')) as post:
+            results = rest.generate_billings_batch([{"owner_id": 1, "pet_id": 2}])
+        self.assertEqual(results, [{"index": 0, "status": "created"}])
+        post.assert_called_once_with('http://billing/billings/bulk/', json=[{"owner_id": 1, "pet_id": 2}])
+
+    def test_server_error_ejects_the_instance_once_and_opens_the_circuit(self):
+        with self.post(fake_response(503)), \
+                mock.patch.object(rest.resolver, 'report_failure') as report_failure:
+            with self.assertRaises(requests.HTTPError):
+                rest.generate_billings_batch([])
+        report_failure.assert_called_once_with('http://billing/')
+        self.assertEqual(self.guard.state, OPEN)
+
+    def test_client_error_does_not_count_against_the_circuit(self):
+        with self.post(fake_response(400)), \
+                mock.patch.object(rest.resolver, 'report_failure') as report_failure:
+            with self.assertRaises(requests.HTTPError):
+                rest.generate_billings_batch([])
+        report_failure.assert_not_called()
+        self.assertEqual(self.guard.state, CLOSED)
+
+
+class DispatchPendingTests(TestCase):
+    def enqueue(self, pet_id, price, owner_id=1):
+        return enqueue_billing({"pet_id": pet_id, "price": price}, owner_id, "insurance", "basic")
+
+    def dispatch(self, **kwargs):
+        return mock.patch.object(outbox, 'generate_billings_batch', **kwargs)
+
+    def test_sends_the_newest_entry_per_billing_and_clears_the_outbox(self):
+        self.enqueue(1, "10.00")
+        self.enqueue(1, "12.50")
+        self.enqueue(2, "20.00")
+        with self.dispatch(return_value=[{"status": "updated"}, {"status": "created"}]) as send:
+            self.assertEqual(outbox.dispatch_pending(), 2)
+        sent = send.call_args.args[0]
+        self.assertEqual([(billing["pet_id"], billing["payment"]) for billing in sent], [(1, "12.50"), (2, "20.00")])
+        self.assertFalse(BillingOutbox.objects.exists())
+
+    def test_claimed_entries_are_leased_while_the_call_runs(self):
+        entry = self.enqueue(1, "10.00")
+
+        def send(billings):
+            leased = BillingOutbox.objects.get(id=entry.id)
+            self.assertGreater(leased.available_at, timezone.now() + timedelta(seconds=50))
+            self.assertEqual(outbox.claim_due(100, 60), [])
+            return [{"status": "created"}]
+
+        with self.dispatch(side_effect=send) as dispatched:
+            outbox.dispatch_pending(lease=60)
+        dispatched.assert_called_once()
+
+    def test_failed_batch_is_retried_with_backoff(self):
+        entry = self.enqueue(1, "10.00")
+        with self.dispatch(side_effect=requests.ConnectionError("refused")):
+            self.assertEqual(outbox.dispatch_pending(), 1)
+        entry.refresh_from_db()
+        self.assertEqual(entry.attempts, 1)
+        self.assertEqual(entry.last_error, "refused")
+        self.assertGreater(entry.available_at, timezone.now())
+        self.assertEqual(outbox.dispatch_pending(), 0)
+
+    def test_open_circuit_defers_without_counting_an_attempt(self):
+        entry = self.enqueue(1, "10.00")
+        with self.dispatch(side_effect=DownstreamUnavailable("billing-service", "circuit_open", 30)):
+            outbox.dispatch_pending()
+        entry.refresh_from_db()
+        self.assertEqual(entry.attempts, 0)
+        self.assertGreater(entry.available_at, timezone.now() + timedelta(seconds=25))
+
+    def test_rejected_entries_are_not_retried(self):
+        self.enqueue(1, "10.00")
+        with self.dispatch(return_value=[{"status": "invalid", "errors": {"payment": ["bad"]}}]):
+            outbox.dispatch_pending()
+        self.assertFalse(BillingOutbox.objects.exists())
+
+    def test_invalid_owner_id_is_not_queued(self):
+        self.assertIsNone(self.enqueue(1, "10.00", owner_id="abc"))
+        self.assertFalse(BillingOutbox.objects.exists())
+
+
+class HealthTests(SimpleTestCase):
+    def test_liveness_does_not_wait_for_start_up(self):
+        with mock.patch.object(type(bootstrap), 'ready', new_callable=mock.PropertyMock, return_value=False):
+            self.assertEqual(self.client.get('/health/').status_code, 200)
+            self.assertEqual(self.client.get('/health/ready/').status_code, 503)
+        with mock.patch.object(type(bootstrap), 'ready', new_callable=mock.PropertyMock, return_value=True):
+            self.assertEqual(self.client.get('/health/ready/').status_code, 200)
+
+
+class BootstrapStepsTests(SimpleTestCase):
+    def test_outbox_dispatcher_discovers_without_registering(self):
+        with mock.patch('sys.argv', ['manage.py', 'dispatch_billing_outbox']):
+            (name, step), *_ = bootstrap_module._steps()
+        self.assertEqual(name, 'eureka_discovery')
+        with mock.patch.object(bootstrap_module.eureka_client, 'init') as init:
+            step()
+        self.assertFalse(init.call_args.kwargs['should_register'])
+        self.assertTrue(init.call_args.kwargs['should_discover'])
+
+    def test_web_server_registers(self):
+        with mock.patch('sys.argv', ['manage.py', 'runserver']):
+            self.assertEqual([name for name, _ in bootstrap_module._steps()][0], 'eureka_registration')
+
+
+class InsuranceCatalogTests(TestCase):
+    def get(self, if_none_match=None):
+        headers = {} if if_none_match is None else {'If-None-Match': if_none_match}
+        return self.client.get('/insurances/', headers=headers)
+
+    def test_revalidation_matches_whole_etags_only(self):
+        etag = self.get()['ETag']
+        for if_none_match in (etag, '"other", ' + etag, 'W/' + etag, '*'):
+            self.assertEqual(self.get(if_none_match).status_code, 304, if_none_match)
+        for if_none_match in (etag[1:-1], etag[:-2] + '"', '"%s"' % etag, '"other"'):
+            self.assertEqual(self.get(if_none_match).status_code, 200, if_none_match)
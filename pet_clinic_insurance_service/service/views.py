@@ -1,27 +1,51 @@
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
 from .models import Insurance, PetInsurance
-from .serializers import InsuranceSerializer, PetInsuranceSerializer
-from .rest import generate_billings
+from .serializers import InsuranceSerializer, PetInsuranceSerializer, PetInsuranceUpsertSerializer
+from .outbox import enqueue_billing, enqueue_billings
+from .enrollment import upsert_pet_insurances
+from .pagination import OptionalPaginationMixin
+from .catalog import get_catalog
+from pet_clinic_insurance_service.bootstrap import bootstrap
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
-class InsuranceViewSet(viewsets.ModelViewSet):
+
+def etag_matches(etag, if_none_match):
+    # If-None-Match compares weakly: a W/ prefix is ignored, and * matches any current representation
+    etags = parse_etags(if_none_match)
+    return etags == ['*'] or etag in (tag[2:] if tag.startswith('W/') else tag for tag in etags)
+
+class InsuranceViewSet(OptionalPaginationMixin, viewsets.ModelViewSet):
     queryset = Insurance.objects.all()
     serializer_class = InsuranceSerializer
 
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if 'cursor' in params or 'page_size' in params:
+            return super().list(request, *args, **kwargs)
+        # the catalog rarely changes, serve it pre-rendered and let repeat clients revalidate
+        catalog = get_catalog()
+        if etag_matches(catalog.etag, request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(catalog.body, content_type='application/json')
+        response['ETag'] = catalog.etag
+        return response
+
     def get_queryset(self):
         logger.info("InsuranceViewSet.get_queryset() called - Fetching insurance records")
-        queryset = super().get_queryset()
-        if not queryset:
-            logger.warning("InsuranceViewSet.get_queryset() - No insurance records found")
-            return []  # Return an empty list if the queryset is empty
-        logger.info(f"InsuranceViewSet.get_queryset() - Found {len(queryset)} insurance records")
-        return queryset
+        # stays lazy: detail routes filter it down to a single indexed row lookup
+        return super().get_queryset()
 
 
-class PetInsuranceViewSet(viewsets.ModelViewSet):
+class PetInsuranceViewSet(OptionalPaginationMixin, viewsets.ModelViewSet):
     queryset = PetInsurance.objects.all()
     serializer_class = PetInsuranceSerializer
     lookup_field = 'pet_id'
@@ -29,66 +53,114 @@ class PetInsuranceViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         owner_id = request.data.get('owner_id')
         pet_id = request.data.get('pet_id')
-        logger.info(f"PetInsuranceViewSet.create() called - Creating pet insurance for owner_id: {owner_id}, pet_id: {pet_id}")
-        logger.debug(f"Request data: {request.data}")
+        logger.info("PetInsuranceViewSet.create() called - Creating pet insurance for owner_id: %s, pet_id: %s", owner_id, pet_id)
+        logger.debug("Request data: %s", request.data)
         
         serializer = self.get_serializer(data=request.data)
         try:
             serializer.is_valid(raise_exception=True)
             self.perform_update(serializer, owner_id)
             headers = self.get_success_headers(serializer.data)
-            logger.info(f"PetInsuranceViewSet.create() - Pet insurance created successfully for pet_id: {pet_id}")
+            logger.info("PetInsuranceViewSet.create() - Pet insurance created successfully for pet_id: %s", pet_id)
             return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
         except Exception as e:
-            logger.error(f"PetInsuranceViewSet.create() - Failed to create pet insurance: {str(e)}")
+            logger.error("PetInsuranceViewSet.create() - Failed to create pet insurance: %s", e)
             raise
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         pet_id = instance.pet_id
         owner_id = request.data.get('owner_id')
-        logger.info(f"PetInsuranceViewSet.update() called - Updating pet insurance for pet_id: {pet_id}, owner_id: {owner_id}")
-        logger.debug(f"Request data: {request.data}")
+        logger.info("PetInsuranceViewSet.update() called - Updating pet insurance for pet_id: %s, owner_id: %s", pet_id, owner_id)
+        logger.debug("Request data: %s", request.data)
         
         serializer = self.get_serializer(instance, data=request.data, partial=True)
 
         if serializer.is_valid():
             self.perform_update(serializer, owner_id)
-            logger.info(f"PetInsuranceViewSet.update() - Pet insurance updated successfully for pet_id: {pet_id}")
+            logger.info("PetInsuranceViewSet.update() - Pet insurance updated successfully for pet_id: %s", pet_id)
             return Response(serializer.data)
         
-        logger.error(f"PetInsuranceViewSet.update() - Validation failed for pet_id: {pet_id}, errors: {serializer.errors}")
+        logger.error("PetInsuranceViewSet.update() - Validation failed for pet_id: %s, errors: %s", pet_id, serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def perform_update(self, serializer, owner_id):
-        logger.info(f"PetInsuranceViewSet.perform_update() called - Saving pet insurance and generating billing")
+        logger.info("PetInsuranceViewSet.perform_update() called - Saving pet insurance and generating billing")
         try:
-            serializer.save()
-            insurance_name = serializer.data.get("insurance_name")
-            logger.debug(f"Generating billing for owner_id: {owner_id}, insurance_name: {insurance_name}")
-            generate_billings(serializer.data, owner_id, "insurance", insurance_name)
-            logger.info(f"PetInsuranceViewSet.perform_update() - Successfully saved and generated billing for owner_id: {owner_id}")
+            # the billing is sent by the outbox dispatcher once this transaction commits
+            with transaction.atomic():
+                serializer.save()
+                insurance_name = serializer.data.get("insurance_name")
+                logger.debug("Queueing billing for owner_id: %s, insurance_name: %s", owner_id, insurance_name)
+                enqueue_billing(serializer.data, owner_id, "insurance", insurance_name)
+            logger.info("PetInsuranceViewSet.perform_update() - Successfully saved and queued billing for owner_id: %s", owner_id)
         except Exception as e:
-            logger.error(f"PetInsuranceViewSet.perform_update() - Failed to save or generate billing: {str(e)}")
+            logger.error("PetInsuranceViewSet.perform_update() - Failed to save or generate billing: %s", e)
             raise
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        items = request.data
+        logger.info("PetInsuranceViewSet.bulk() called - Enrolling pet insurances")
+        if not isinstance(items, list):
+            return Response({'message': 'Expected a list of pet insurance records'}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = int(os.getenv("PET_INSURANCE_BULK_MAX_ITEMS", 5_000))
+        if len(items) > max_items:
+            return Response({'message': f'At most {max_items} pet insurance records per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = {}
+        for index, item in enumerate(items):
+            serializer = PetInsuranceUpsertSerializer(data=item)
+            if not serializer.is_valid():
+                results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+                continue
+            pet_id = serializer.validated_data['pet_id']
+            if pet_id in valid:
+                # the last record for a pet wins, as it would with sequential calls
+                results[valid[pet_id][0]] = {'index': valid[pet_id][0], 'status': 'superseded', 'superseded_by': index}
+            valid[pet_id] = (index, serializer.validated_data)
+
+        # the billings are sent in batches by the outbox dispatcher once this transaction commits
+        with transaction.atomic():
+            upserted = upsert_pet_insurances([data for _, data in valid.values()])
+            enqueue_billings(
+                (PetInsuranceSerializer(pet_insurance).data, items[index].get('owner_id'), "insurance", pet_insurance.insurance_name)
+                for (index, _), (pet_insurance, _) in zip(valid.values(), upserted)
+            )
+        for (index, _), (pet_insurance, created) in zip(valid.values(), upserted):
+            results[index] = {'index': index, 'status': 'created' if created else 'updated', 'id': pet_insurance.pk}
+
+        counts = {outcome: 0 for outcome in ('created', 'updated', 'superseded', 'invalid')}
+        for result in results:
+            counts[result['status']] += 1
+        logger.info("PetInsuranceViewSet.bulk() completed - %s", counts)
+        return Response({**counts, 'results': results})
+
     def send_update_notification(self, instance):
         # Your custom logic to send a notification
         # after the instance is updated
-        logger.info(f"PetInsuranceViewSet.send_update_notification() called - Sending notification for pet_id: {instance.pet_id}")
+        logger.info("PetInsuranceViewSet.send_update_notification() called - Sending notification for pet_id: %s", instance.pet_id)
         logger.debug("PetInsuranceViewSet.send_update_notification() - Notification logic not implemented yet")
         pass
 
     def get_queryset(self):
         logger.info("PetInsuranceViewSet.get_queryset() called - Fetching pet insurance records")
-        queryset = super().get_queryset()
-        if not queryset:
-            logger.warning("PetInsuranceViewSet.get_queryset() - No pet insurance records found")
-            return []  # Return an empty list if the queryset is empty
-        logger.info(f"PetInsuranceViewSet.get_queryset() - Found {len(queryset)} pet insurance records")
-        return queryset
+        # stays lazy: detail routes filter it down to a single indexed row lookup
+        return super().get_queryset()
 
 class HealthViewSet(viewsets.ViewSet):
     def list(self, request):
+        # liveness: the process serves requests, start-up steps that are still retrying
+        # must not get it restarted
         logger.info("HealthViewSet.list() called - Health check requested")
         logger.info("HealthViewSet.list() - Insurance service is healthy")
-        return Response({'message':'ok'}, status=status.HTTP_200_OK)
+        return Response({'message':'ok', 'startup': bootstrap.status()}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='ready')
+    def ready(self, request):
+        # readiness: keep traffic away until every start-up step has completed
+        startup = bootstrap.status()
+        if not bootstrap.ready:
+            logger.warning("HealthViewSet.ready() - Start-up not complete: %s", startup)
+            return Response({'message': 'starting', 'startup': startup}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'message': 'ready', 'startup': startup}, status=status.HTTP_200_OK)
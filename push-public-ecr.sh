@@ -47,12 +47,12 @@ docker tag springcommunity/spring-petclinic-admin-server:latest ${repo_uri}:late
 docker push ${repo_uri}:latest
 
 repo_uri=$(get_repo_link python-petclinic-insurance-service   )
-docker build -t insurance-service ./pet_clinic_insurance_service --no-cache
+docker build --build-context common=./pet_clinic_common -t insurance-service ./pet_clinic_insurance_service --no-cache
 docker tag insurance-service:latest ${repo_uri}:latest
 docker push ${repo_uri}:latest
 
 repo_uri=$(get_repo_link python-petclinic-billing-service   )
-docker build -t billing-service ./pet_clinic_billing_service --no-cache
+docker build --build-context common=./pet_clinic_common -t billing-service ./pet_clinic_billing_service --no-cache
 docker tag billing-service:latest ${repo_uri}:latest
 docker push ${repo_uri}:latest
 
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Local load test of the Python services under each serving mode.
+
+Starts the service under the Django development server, gunicorn (WSGI, gthread) and
+gunicorn with uvicorn workers (ASGI) in turn, drives it with keep-alive clients for a
+fixed time and prints throughput, latency and throughput per core. Cores are the CPU
+time the server processes used divided by the wall time, read from /proc (Linux only).
+
+    pip install gunicorn uvicorn uvicorn-worker
+    (cd pet_clinic_insurance_service && python manage.py migrate)
+    python scripts/loadtest/django_serving_modes.py --service insurance --duration 30
+
+Start-up network calls are disabled (BOOTSTRAP_ENABLED=false), the services use their
+local sqlite database unless DATABASE_PROFILE is set.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from pathlib import Path
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[2]
+SERVICES = {
+    'billing': (ROOT / 'pet_clinic_billing_service', '/billings/?page_size=50'),
+    'insurance': (ROOT / 'pet_clinic_insurance_service', '/insurances/'),
+}
+MODES = ('runserver', 'wsgi', 'asgi')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def server_command(mode, port):
+    if mode == 'runserver':
+        return [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload'], {}
+    env = {'GUNICORN_WORKER_CLASS': 'uvicorn_worker.UvicornWorker'} if mode == 'asgi' else {}
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}'], env
+
+
+def wait_until_serving(port, path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', path)
+            if conn.getresponse().status < 500:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"server on port {port} did not come up within {timeout}s")
+
+
+def process_tree(pid):
+    pids = [pid]
+    for child in Path(f'/proc/{pid}/task').glob('*/children'):
+        for child_pid in child.read_text().split():
+            pids.extend(process_tree(int(child_pid)))
+    return pids
+
+
+def cpu_seconds(pid):
+    total = 0
+    for p in process_tree(pid):
+        try:
+            # utime and stime are fields 14 and 15, after the parenthesised command name
+            fields = Path(f'/proc/{p}/stat').read_text().rsplit(')', 1)[1].split()
+        except FileNotFoundError:
+            continue
+        total += int(fields[11]) + int(fields[12])
+    return total / CLOCK_TICKS
+
+
+def client(args):
+    port, path, threads, duration = args
+    deadline = time.monotonic() + duration
+
+    def run(_):
+        latencies, errors = [], 0
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            latencies.append(time.perf_counter() - start)
+        conn.close()
+        return latencies, errors
+
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(run, range(threads)))
+    return [l for latencies, _ in results for l in latencies], sum(errors for _, errors in results)
+
+
+def measure(mode, service_dir, path, port, concurrency, client_processes, duration):
+    command, extra_env = server_command(mode, port)
+    env = {**os.environ, 'BOOTSTRAP_ENABLED': 'false', 'LOG_LEVEL': 'WARNING', **extra_env}
+    server = subprocess.Popen(command, cwd=service_dir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_serving(port, path)
+        threads = max(1, concurrency // client_processes)
+        cpu_start, wall_start = cpu_seconds(server.pid), time.monotonic()
+        with Pool(client_processes) as pool:
+            results = pool.map(client, [(port, path, threads, duration)] * client_processes)
+        wall = time.monotonic() - wall_start
+        cores = (cpu_seconds(server.pid) - cpu_start) / wall
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = sorted(l for latencies, _ in results for l in latencies)
+    errors = sum(errors for _, errors in results)
+    rps = len(latencies) / wall
+    return {
+        'mode': mode,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': rps,
+        'p50_ms': latencies[len(latencies) // 2] * 1_000 if latencies else 0,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1_000 if latencies else 0,
+        'cores': cores,
+        'rps_per_core': rps / cores if cores else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--service', choices=SERVICES, default='insurance')
+    parser.add_argument('--mode', choices=MODES + ('all',), default='all')
+    parser.add_argument('--path', help="endpoint to request, defaults to a list endpoint of the service")
+    parser.add_argument('--port', type=int, default=18000)
+    parser.add_argument('--concurrency', type=int, default=32, help="concurrent keep-alive connections")
+    parser.add_argument('--client-processes', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--duration', type=float, default=20, help="seconds per mode")
+    args = parser.parse_args()
+
+    service_dir, default_path = SERVICES[args.service]
+    path = args.path or default_path
+    modes = MODES if args.mode == 'all' else (args.mode,)
+
+    print(f"{args.service} {path}, {args.concurrency} connections, {args.duration:g}s per mode")
+    print(f"{'mode':<10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'cores':>6} {'req/s/core':>11}")
+    for mode in modes:
+        r = measure(mode, service_dir, path, args.port, args.concurrency, args.client_processes, args.duration)
+        print(f"{r['mode']:<10} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['cores']:>6.2f} {r['rps_per_core']:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()